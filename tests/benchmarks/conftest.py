@@ -0,0 +1,43 @@
+import os
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Count
+
+from posts.models import Group
+
+VOLUMES = {
+    'users': int(os.environ.get('BENCH_USERS', 200)),
+    'groups': int(os.environ.get('BENCH_GROUPS', 20)),
+    'posts': int(os.environ.get('BENCH_POSTS', 5000)),
+    'comments': int(os.environ.get('BENCH_COMMENTS', 5000)),
+    'follows': int(os.environ.get('BENCH_FOLLOWS', 2000)),
+}
+
+
+@pytest.fixture(scope='session')
+def seeded(django_db_setup, django_db_blocker):
+    """Заполняет тестовую базу объёмом из переменных BENCH_* один раз
+    на сессию, возвращает объекты для построения адресов."""
+    with django_db_blocker.unblock():
+        call_command('seed', seed=0, **VOLUMES)
+        call_command('compute_suggestions')
+        users = get_user_model().objects.annotate(
+            subscriptions=Count('follower', distinct=True),
+            subscribers=Count('following', distinct=True),
+        )
+        reader = users.order_by('-subscriptions').first()
+        author = users.exclude(pk=reader.pk).order_by('-subscribers').first()
+        post = author.posts.first()
+        group = Group.objects.annotate(
+            amount=Count('posts')
+        ).order_by('-amount').first()
+        return {'reader': reader, 'author': author, 'post': post,
+                'group': group}
+
+
+@pytest.fixture
+def bench_client(client, seeded):
+    client.force_login(seeded['reader'])
+    return client
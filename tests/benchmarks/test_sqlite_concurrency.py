@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+from django.conf import settings
+
+from posts.sqlite import apply_pragmas
+
+pytestmark = pytest.mark.benchmark
+
+READERS = int(os.environ.get('BENCH_SQLITE_READERS', 4))
+WRITERS = int(os.environ.get('BENCH_SQLITE_WRITERS', 1))
+SECONDS = float(os.environ.get('BENCH_SQLITE_SECONDS', 2))
+ROWS = 5000
+
+
+def connect(path, pragmas):
+    connection = sqlite3.connect(
+        path, timeout=5, isolation_level=None, check_same_thread=False
+    )
+    apply_pragmas(connection, pragmas)
+    return connection
+
+
+def read(connection):
+    connection.execute(
+        'SELECT id, text FROM post ORDER BY pub_date DESC LIMIT 10'
+    ).fetchall()
+
+
+def write(connection):
+    connection.execute(
+        "INSERT INTO post (text, pub_date) VALUES ('новый пост', ?)",
+        (time.time(),)
+    )
+
+
+def run(path, pragmas):
+    """Читатели и писатели в своих потоках SECONDS секунд подряд;
+    возвращает операции в секунду и ошибки database is locked."""
+    setup = connect(path, pragmas)
+    setup.execute(
+        'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT, pub_date REAL)'
+    )
+    setup.execute('CREATE INDEX post_pub_date ON post (pub_date)')
+    setup.execute('BEGIN')
+    setup.executemany(
+        'INSERT INTO post (text, pub_date) VALUES (?, ?)',
+        (('пост', number) for number in range(ROWS))
+    )
+    setup.execute('COMMIT')
+    setup.close()
+    done = {'read': 0, 'write': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + SECONDS
+
+    def worker(operation, kind):
+        connection = connect(path, pragmas)
+        count = locked = 0
+        while time.perf_counter() < deadline:
+            try:
+                operation(connection)
+                count += 1
+            except sqlite3.OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                locked += 1
+        connection.close()
+        with lock:
+            done[kind] += count
+            done['locked'] += locked
+
+    threads = [
+        threading.Thread(target=worker, args=(read, 'read'))
+        for _ in range(READERS)
+    ] + [
+        threading.Thread(target=worker, args=(write, 'write'))
+        for _ in range(WRITERS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'reads_per_second': done['read'] / SECONDS,
+        'writes_per_second': done['write'] / SECONDS,
+        'locked': done['locked'],
+    }
+
+
+def test_production_profile_concurrency(tmp_path):
+    """Пропускная способность читателей и писателей без профиля и
+    с SQLITE_PRAGMAS. В WAL читатели не ждут писателя, а писатель
+    с synchronous=normal не синхронизирует диск на каждом коммите."""
+    # Без профиля - настройки SQLite по умолчанию, как у Django до него:
+    # журнал отката, synchronous=full, ожидание блокировки 5 с
+    profiles = {'default': {}, 'production': settings.SQLITE_PRAGMAS}
+    results = {
+        name: run(str(tmp_path / f'{name}.sqlite3'), pragmas)
+        for name, pragmas in profiles.items()
+    }
+    for name, result in results.items():
+        print(
+            f'{name}: чтений {result["reads_per_second"]:.0f}/с, '
+            f'записей {result["writes_per_second"]:.0f}/с, '
+            f'database is locked {result["locked"]}'
+        )
+    before, after = results['default'], results['production']
+    assert after['locked'] == 0
+    assert after['writes_per_second'] >= before['writes_per_second']
+    assert (after['reads_per_second'] + after['writes_per_second']
+            >= before['reads_per_second'] + before['writes_per_second'])
@@ -0,0 +1,155 @@
+import json
+import math
+import os
+import statistics
+import time
+import tracemalloc
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from about.urls import urlpatterns as about_urlpatterns
+from posts.api_urls import urlpatterns as api_urlpatterns
+from posts.urls import urlpatterns as posts_urlpatterns
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db]
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+RUNS = int(os.environ.get('BENCH_RUNS', 5))
+TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 2.0))
+# Запас на шум таймера для быстрых страниц
+SLACK_MS = float(os.environ.get('BENCH_SLACK_MS', 10))
+UPDATE = os.environ.get('BENCH_UPDATE') == '1'
+
+ROUTES = {
+    'posts': lambda s: {},
+    'group': lambda s: {'slug': s['group'].slug},
+    'new_post': lambda s: {},
+    'export': lambda s: {},
+    'follow_index': lambda s: {},
+    'follow_unread': lambda s: {},
+    'profile': lambda s: {'username': s['author'].username},
+    'post': lambda s: {'username': s['author'].username,
+                       'post_id': s['post'].id},
+    'comments': lambda s: {'username': s['author'].username,
+                           'post_id': s['post'].id},
+    'post_edit': lambda s: {'username': s['author'].username,
+                            'id_post': s['post'].id},
+    'add_comment': lambda s: {'username': s['author'].username,
+                              'post_id': s['post'].id},
+    'profile_follow': lambda s: {'username': s['author'].username},
+    'profile_unfollow': lambda s: {'username': s['author'].username},
+    'search': lambda s: {},
+    'api:posts': lambda s: {},
+    'api:posts_batch': lambda s: {},
+    'api:group_posts': lambda s: {'slug': s['group'].slug},
+    'api:author_posts': lambda s: {'username': s['author'].username},
+    'api:follow_posts': lambda s: {},
+    'about:author': lambda s: {},
+    'about:tech': lambda s: {},
+}
+# Строки запроса для адресов, которым без них нечего показать
+QUERY_STRINGS = {
+    'search': 'q=%D0%BF%D0%BE%D1%81%D1%82',
+    'api:posts_batch': 'ids=' + ','.join(map(str, range(1, 101))),
+}
+# Адреса, которые читателю отвечают перенаправлением: замеряем от автора
+AS_AUTHOR = {'post_edit'}
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(name, result):
+    baseline = load_baseline()
+    baseline[name] = {
+        'queries': result['queries'],
+        'ms': math.ceil(result['ms']),
+        'peak_kb': math.ceil(result['peak_kb']),
+    }
+    with open(BASELINE_PATH, 'w', encoding='utf-8') as file:
+        json.dump(baseline, file, indent=4, sort_keys=True)
+        file.write('\n')
+
+
+def fetch(client, url, **headers):
+    """Запрос с чтением потокового ответа целиком, по частям."""
+    response = client.get(url, **headers)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(client, url):
+    """Медиана времени ответа, число запросов и пик памяти на один
+    запрос к url с пустым кэшем."""
+    headers = {'HTTP_REFERER': '/'}
+    fetch(client, url, **headers)
+    timings = []
+    query_counts = []
+    for _ in range(RUNS):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = fetch(client, url, **headers)
+            timings.append((time.perf_counter() - start) * 1000)
+        query_counts.append(len(queries))
+    assert response.status_code < 400, f'{url}: {response.status_code}'
+    cache.clear()
+    tracemalloc.start()
+    try:
+        fetch(client, url, **headers)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': max(query_counts),
+        'ms': statistics.median(timings),
+        'peak_kb': peak / 1024,
+    }
+
+
+def test_every_route_benchmarked():
+    """Каждый адрес из posts/urls.py, posts/api_urls.py и about/urls.py
+    покрыт замером."""
+    names = [pattern.name for pattern in posts_urlpatterns]
+    names += [f'api:{pattern.name}' for pattern in api_urlpatterns]
+    names += [f'about:{pattern.name}' for pattern in about_urlpatterns]
+    missing = set(names) - set(ROUTES)
+    assert not missing, f'Добавьте замер для адресов: {sorted(missing)}'
+
+
+@pytest.mark.parametrize('name', sorted(ROUTES))
+def test_view_within_baseline(name, bench_client, seeded):
+    url = reverse(name, kwargs=ROUTES[name](seeded))
+    if name in AS_AUTHOR:
+        bench_client.force_login(seeded['author'])
+    if name in QUERY_STRINGS:
+        url = f'{url}?{QUERY_STRINGS[name]}'
+    result = measure(bench_client, url)
+    if UPDATE:
+        save_baseline(name, result)
+        return
+    expected = load_baseline().get(name)
+    assert expected is not None, (
+        f'Нет базовой линии для `{name}`, запустите с BENCH_UPDATE=1'
+    )
+    assert result['queries'] <= expected['queries'], (
+        f'`{url}`: {result["queries"]} запросов, '
+        f'базовая линия {expected["queries"]}'
+    )
+    assert result['ms'] <= expected['ms'] * TOLERANCE + SLACK_MS, (
+        f'`{url}`: {result["ms"]:.1f} мс, базовая линия {expected["ms"]} мс'
+    )
+    assert result['peak_kb'] <= expected['peak_kb'] * TOLERANCE, (
+        f'`{url}`: пик памяти {result["peak_kb"]:.0f} КБ, '
+        f'базовая линия {expected["peak_kb"]} КБ'
+    )
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Post, Group, Comment, Follow
+from .models import Post, Group, Comment, Follow, Task
+from .search import search_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,8 +10,21 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по поисковому индексу вместо LIKE по всей таблице."""
+        if not search_term:
+            return queryset, False
+        return search_posts(search_term, queryset), False
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("pk", "name", "state", "attempts", "run_at", "finished")
+    list_filter = ("state", "name")
+    search_fields = ("key",)
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
 admin.site.register(Comment)
 admin.site.register(Follow)
+admin.site.register(Task, TaskAdmin)
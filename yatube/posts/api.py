@@ -0,0 +1,141 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .feed import FeedPaginator
+from .models import Group, Post
+from .page_cache import cache_anonymous
+from .paginators import ID_MAX, CursorPaginator
+
+User = get_user_model()
+
+# Поля поста в ответах API и пути к ним для .values()
+FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comment_count': 'comment_count',
+}
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def requested_fields(request):
+    """Поля из параметра fields=id,text, без него - все поля."""
+    names = [
+        name.strip() for name in request.GET.get('fields', '').split(',')
+        if name.strip()
+    ]
+    unknown = set(names) - set(FIELDS)
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    return names or list(FIELDS)
+
+
+def project(queryset, names):
+    """Выборка словарей только с нужными столбцами. id и pub_date
+    нужны всегда - по ним строится курсор."""
+    paths = {FIELDS[name] for name in names} | {'id', 'pub_date'}
+    return queryset.values(*paths)
+
+
+def serialize(row, names):
+    item = {name: row[FIELDS[name]] for name in names}
+    if 'image' in item:
+        image = item['image']
+        item['image'] = default_storage.url(image) if image else None
+    return item
+
+
+def feed_response(request, queryset, paginator_class=CursorPaginator):
+    """Страница ленты по курсору из параметра cursor."""
+    try:
+        names = requested_fields(request)
+    except ValueError as exception:
+        return error(str(exception), 400)
+    page = paginator_class(
+        project(queryset, names), settings.PAGE_MAX
+    ).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [serialize(row, names) for row in page],
+        'next': page.paginator.next_cursor,
+        'previous': page.paginator.previous_cursor,
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@cache_anonymous('all')
+@require_GET
+def posts(request):
+    """Все посты, новые первыми."""
+    return feed_response(request, Post.objects.all())
+
+
+@cache_anonymous('group:{slug}')
+@require_GET
+def group_posts(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    if group_id is None:
+        return error('Группа не найдена', 404)
+    return feed_response(request, Post.objects.filter(group_id=group_id))
+
+
+@cache_anonymous('author:{username}')
+@require_GET
+def author_posts(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return error('Автор не найден', 404)
+    return feed_response(request, Post.objects.filter(author_id=author_id))
+
+
+@require_GET
+def follow_posts(request):
+    """Лента подписок текущего пользователя."""
+    if not request.user.is_authenticated:
+        return error('Нужно войти', 401)
+    return feed_response(request, Post.objects.all(), partial(
+        FeedPaginator, user=request.user
+    ))
+
+
+@cache_anonymous('all')
+@require_GET
+def posts_batch(request):
+    """Посты по списку ids=1,2,3 одним запросом в порядке списка.
+    Ненайденные id перечисляются в missing."""
+    try:
+        names = requested_fields(request)
+    except ValueError as exception:
+        return error(str(exception), 400)
+    try:
+        ids = list(dict.fromkeys(
+            int(pk) for pk in request.GET.get('ids', '').split(',') if pk
+        ))
+    except ValueError:
+        return error('ids - это числа через запятую', 400)
+    if any(not -ID_MAX - 1 <= pk <= ID_MAX for pk in ids):
+        return error('ids - это числа через запятую', 400)
+    if not ids:
+        return error('Передайте ids', 400)
+    if len(ids) > settings.API_BATCH_MAX:
+        return error(f'Не больше {settings.API_BATCH_MAX} id за запрос', 400)
+    queryset = Post.objects.filter(pk__in=ids).order_by()
+    rows = {row['id']: row for row in project(queryset, names)}
+    return JsonResponse({
+        'results': [serialize(rows[pk], names) for pk in ids if pk in rows],
+        'missing': [pk for pk in ids if pk not in rows],
+    }, json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,33 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path(
+        'posts/',
+        api.posts,
+        name='posts'
+    ),
+    path(
+        'posts/batch/',
+        api.posts_batch,
+        name='posts_batch'
+    ),
+    path(
+        'groups/<slug:slug>/posts/',
+        api.group_posts,
+        name='group_posts'
+    ),
+    path(
+        'authors/<str:username>/posts/',
+        api.author_posts,
+        name='author_posts'
+    ),
+    path(
+        'follow/',
+        api.follow_posts,
+        name='follow_posts'
+    ),
+]
@@ -0,0 +1,240 @@
+import gzip
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (ManifestStaticFilesStorage,
+                                                staticfiles_storage)
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сжимаются только текстовые форматы: картинки и шрифты woff уже сжаты
+COMPRESSIBLE = (
+    '.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml',
+    '.ttf', '.eot',
+)
+# Range на один диапазон: bytes=0-99, bytes=100-, bytes=-100
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Имя с хэшем содержимого не меняется никогда, его кэшируют на год
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Кодировка Content-Encoding, расширение сжатой копии, функция сжатия;
+# лучшая - первой. mtime=0: одинаковый файл даёт одинаковый архив
+COMPRESSORS = [
+    ('gzip', '.gz', lambda data: gzip.compress(data, 9, mtime=0)),
+]
+# brotli необязателен: без него собираются только копии .gz
+if brotli is not None:
+    COMPRESSORS.insert(
+        0, ('br', '.br', lambda data: brotli.compress(data, quality=11))
+    )
+# Отдать можно и копии, собранные там, где brotli был
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """Статика с хэшем содержимого в имени файла, ссылки в CSS
+    переписываются по манифесту. collectstatic рядом с каждым текстовым
+    файлом кладёт сжатые копии .gz и .br, если они меньше исходного."""
+
+    def load_manifest(self):
+        hashed_files = super().load_manifest()
+        self.immutable_files = set(hashed_files.values())
+        return hashed_files
+
+    def save_manifest(self):
+        super().save_manifest()
+        self.immutable_files = set(self.hashed_files.values())
+
+    def stored_name(self, name):
+        """Файл, которого нет в манифесте (сборку ещё не запускали),
+        отдаётся под своим именем, а не ломает страницу."""
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Промежуточные имена из проходов по CSS не нужны, сжимаются
+        # исходные и окончательные из манифеста
+        for name in sorted({*paths, *self.hashed_files.values()}):
+            if name.endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        for _, suffix, compress in COMPRESSORS:
+            packed = compress(data)
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            if len(packed) < len(data):
+                self._save(name + suffix, ContentFile(packed))
+
+
+def _accepted(request):
+    """Кодировки из Accept-Encoding, кроме запрещённых через q=0."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        name, _, quality = params.strip().partition('=')
+        try:
+            if name.strip() == 'q' and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _resolve(root, path):
+    """Путь к файлу path внутри root или 404, в том числе для попыток
+    выйти за root через ../."""
+    try:
+        fullpath = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    return fullpath
+
+
+def serve(request, path):
+    """Отдаёт файл из STATIC_ROOT: сжатую копию под Accept-Encoding,
+    если она есть, и с вечным кэшем, если в имени есть хэш."""
+    fullpath = _resolve(settings.STATIC_ROOT, path)
+    content_type, _ = mimetypes.guess_type(fullpath)
+    served, encoding = fullpath, None
+    accepted = _accepted(request)
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(fullpath + suffix):
+            served, encoding = fullpath + suffix, coding
+            break
+    stat = os.stat(served)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            open(served, 'rb'),
+            content_type=content_type or 'application/octet-stream'
+        )
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    immutable = path in getattr(staticfiles_storage, 'immutable_files', ())
+    response['Cache-Control'] = IMMUTABLE if immutable else 'public, no-cache'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def _byte_range(header, size):
+    """Диапазон (первый, последний байт) из заголовка Range. None -
+    заголовок не разобран или диапазонов несколько, отдаётся весь файл;
+    ValueError - диапазон начинается за концом файла."""
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError(header)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def _range_applies(request, etag, last_modified):
+    """If-Range: диапазон отдаётся, только если файл не менялся
+    с тех пор, как клиент получил начало."""
+    condition = request.META.get('HTTP_IF_RANGE')
+    if condition is None:
+        return True
+    if condition.startswith('"'):
+        return condition == etag
+    return parse_http_date_safe(condition) == last_modified
+
+
+def _read(file, length, block_size=FileResponse.block_size):
+    with file:
+        while length > 0:
+            block = file.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _media_response(request, fullpath, path, size, etag, last_modified):
+    content_type = (
+        mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    )
+    if settings.MEDIA_OFFLOAD:
+        # Файл с диска отдаёт фронтовой сервер, диапазоны тоже он
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = (
+                settings.MEDIA_OFFLOAD_PREFIX + quote(path)
+            )
+        else:
+            response['X-Sendfile'] = fullpath
+        return response
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _range_applies(
+        request, etag, last_modified
+    ):
+        try:
+            byte_range = _byte_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        return FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    first, last = byte_range
+    file = open(fullpath, 'rb')
+    file.seek(first)
+    response = StreamingHttpResponse(
+        _read(file, last - first + 1), status=206, content_type=content_type
+    )
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    response['Content-Length'] = last - first + 1
+    return response
+
+
+def serve_media(request, path):
+    """Отдаёт загруженный файл из MEDIA_ROOT с проверкой ETag
+    и Last-Modified и с поддержкой Range. С MEDIA_OFFLOAD вместо
+    содержимого возвращает заголовок X-Sendfile или X-Accel-Redirect."""
+    fullpath = _resolve(settings.MEDIA_ROOT, path)
+    stat = os.stat(fullpath)
+    last_modified = int(stat.st_mtime)
+    etag = f'"{last_modified:x}-{stat.st_size:x}"'
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    ) or _media_response(
+        request, fullpath, path, stat.st_size, etag, last_modified
+    )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,156 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .feed import unread_count
+from .models import Follow, Group, Post
+from .suggestions import suggestions_for
+
+User = get_user_model()
+
+# Поля карточки автора: имя и счётчики из UserStats
+AUTHOR_FIELDS = (
+    'first_name', 'last_name', 'stats__posts_count',
+    'stats__followers_count', 'stats__following_count',
+)
+
+
+def _newest(field):
+    """Дата последнего поста, где field = pk внешней строки: один шаг
+    по индексу (field, pub_date). Ловит и посты, записанные в обход
+    сигналов, которые ведут версии лент."""
+    return Subquery(Post.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by('-pub_date').values('pub_date')[:1])
+
+
+def is_followed(request, author_id):
+    """Подписан ли зритель на автора. Ответ запоминается на запросе:
+    его спрашивают и проверка ETag, и сама страница."""
+    if not hasattr(request, '_followed'):
+        request._followed = {}
+    followed = request._followed
+    if author_id not in followed:
+        followed[author_id] = request.user.is_authenticated and (
+            Follow.objects.filter(
+                author_id=author_id, user=request.user
+            ).exists()
+        )
+    return followed[author_id]
+
+
+def suggested(request):
+    """Рекомендации «кого почитать» зрителю, запоминаются на запросе:
+    они входят и в ETag профиля, и в саму страницу."""
+    if not hasattr(request, '_suggested'):
+        request._suggested = []
+        if request.user.is_authenticated:
+            request._suggested = list(suggestions_for(request.user))
+    return request._suggested
+
+
+def unread_posts(request):
+    """Непрочитанные посты ленты подписок зрителя, не больше
+    FEED_UNREAD_MAX + 1: больше показывать незачем. Ответ запоминается
+    на запросе, как и в is_followed."""
+    if not hasattr(request, '_unread'):
+        request._unread = request.user.is_authenticated and unread_count(
+            request.user, settings.FEED_UNREAD_MAX + 1
+        )
+    return request._unread
+
+
+def profile_state(request, username):
+    """Версия ленты автора растёт при публикации, правке, удалении
+    и комментарии его постов."""
+    author = User.objects.filter(username=username).annotate(
+        newest=_newest('author')
+    ).values_list(
+        'pk', *AUTHOR_FIELDS, 'stats__posts_version', 'newest'
+    ).order_by('pk').first()
+    if author is None:
+        return None
+    return [
+        author, is_followed(request, author[0]),
+        [suggestion.author_id for suggestion in suggested(request)],
+    ]
+
+
+def group_state(request, slug):
+    group = Group.objects.filter(slug=slug).annotate(
+        newest=_newest('group')
+    ).values_list(
+        'pk', 'title', 'description', 'version', 'newest'
+    ).order_by('pk').first()
+    if group is None:
+        return None
+    return [group]
+
+
+def post_state(request, username, post_id):
+    """Версия поста растёт при правке и при каждом комментарии.
+    Вошедшему зрителю страница показывает форму комментария с токеном
+    CSRF, который меняется при входе: со старым форма получит 403."""
+    post = Post.objects.filter(
+        pk=post_id, author__username=username
+    ).values_list(
+        'version', 'author_id',
+        *[f'author__{field}' for field in AUTHOR_FIELDS]
+    ).order_by()[:1]
+    if not post:
+        return None
+    version, author_id, *author = post[0]
+    return [
+        version, author_id, author, is_followed(request, author_id),
+        request.user.is_authenticated and request.META.get('CSRF_COOKIE'),
+    ]
+
+
+def unread_state(request):
+    return [unread_posts(request)]
+
+
+def conditional_page(state):
+    """Отвечает 304 на условный GET, если страница не менялась.
+    state(request, **kwargs) дешёвыми запросами по индексам возвращает
+    части ETag или None, если страницы нет. В ETag входит и зритель:
+    от него зависят меню и кнопка подписки. Счётчика новых постов
+    (unread_posts) в ETag нет: меню с ним есть только на главной
+    и в ленте подписок, без условных GET; страница, которая его
+    покажет, должна добавить unread_posts(request) в свой state.
+
+    Last-Modified не отправляется: дата не отражает правки, удаления
+    и то, что видит зритель, и клиент с одним If-Modified-Since
+    получил бы устаревший 304."""
+    def current(request, kwargs):
+        if not hasattr(request, '_page_state'):
+            request._page_state = None
+            if request.method in ('GET', 'HEAD'):
+                request._page_state = state(request, **kwargs)
+        return request._page_state
+
+    def etag(request, *args, **kwargs):
+        found = current(request, kwargs)
+        if found is None:
+            return None
+        raw = repr([request.user.pk, *found])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                # Без no-cache браузер сам решит, что страница свежая,
+                # и покажет её, не спрашивая сервер
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, UserStats
+
+
+def _add(queryset, **deltas):
+    for field, delta in deltas.items():
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def bump_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя, например
+    bump_stats(user_id, posts_count=1)."""
+    _add(UserStats.objects.filter(user_id=user_id), **deltas)
+
+
+def bump_listings(authors=(), groups=()):
+    """Увеличивает версии лент авторов и групп: с датой последнего
+    поста они дают ETag профиля и группы без агрегатов по всем постам.
+    authors и groups - списки id или выборки из одного столбца."""
+    _add(UserStats.objects.filter(user_id__in=authors), posts_version=1)
+    _add(Group.objects.filter(pk__in=groups), version=1)
+
+
+def _bump_owners(posts):
+    posts = posts.order_by()
+    bump_listings(posts.values('author_id'), posts.values('group_id'))
+
+
+def bump_comments(post_id, delta):
+    """Атомарно сдвигает счётчик комментариев поста, версию его
+    карточки и версии лент, где он виден."""
+    posts = Post.objects.filter(pk=post_id)
+    _add(posts, comment_count=delta, version=1)
+    _bump_owners(posts)
+
+
+def bump_versions(posts):
+    """Сбрасывает кэш карточек постов выборки, увеличивая их версию,
+    и версии лент их авторов и групп."""
+    _add(posts, version=1)
+    _bump_owners(posts)
+
+
+def _count(model, field):
+    """Подзапрос с числом строк model, у которых field совпадает
+    с pk внешнего запроса."""
+    rows = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def user_counts(users):
+    """Добавляет к выборке пользователей пересчитанные счётчики."""
+    return users.annotate(
+        real_posts=_count(Post, 'author'),
+        real_followers=_count(Follow, 'author'),
+        real_following=_count(Follow, 'user'),
+    )
+
+
+def recount_users(users):
+    """Пересчитывает UserStats для выборки пользователей,
+    возвращает число исправленных строк."""
+    fixed = 0
+    for user in user_counts(users):
+        counts = {
+            'posts_count': user.real_posts,
+            'followers_count': user.real_followers,
+            'following_count': user.real_following,
+        }
+        stats, created = UserStats.objects.get_or_create(
+            user=user, defaults=counts
+        )
+        if created:
+            fixed += 1
+        elif any(getattr(stats, k) != v for k, v in counts.items()):
+            UserStats.objects.filter(pk=stats.pk).update(**counts)
+            fixed += 1
+    return fixed
+
+
+def recount_posts(posts):
+    """Пересчитывает Post.comment_count для выборки постов,
+    возвращает число исправленных строк."""
+    stale = posts.annotate(
+        real_comments=_count(Comment, 'post')
+    ).exclude(comment_count=F('real_comments'))
+    fixed = 0
+    for post in stale:
+        Post.objects.filter(pk=post.pk).update(
+            comment_count=post.real_comments
+        )
+        fixed += 1
+    return fixed
+
+
+def stats_for(user):
+    """Счётчики пользователя; если строки ещё нет, она создаётся
+    пересчётом."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        user_model = type(user)
+        recount_users(user_model.objects.filter(pk=user.pk))
+        return UserStats.objects.get(user=user)
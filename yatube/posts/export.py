@@ -0,0 +1,68 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Post
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+# Столбцы CSV: общие для постов и комментариев, лишние остаются пустыми
+CSV_COLUMNS = (
+    'type', 'id', 'date', 'post', 'group', 'text', 'image', 'comment_count'
+)
+
+
+def export_rows(user, chunk_size):
+    """Посты, затем комментарии пользователя словарями. Строки читаются
+    из базы частями по chunk_size, в памяти не копится вся история."""
+    posts = Post.objects.filter(author=user).order_by('pk').values_list(
+        'pk', 'pub_date', 'group__slug', 'text', 'image', 'comment_count'
+    )
+    for pk, pub_date, group, text, image, comments in posts.iterator(
+        chunk_size=chunk_size
+    ):
+        yield {
+            'type': 'post', 'id': pk, 'date': pub_date, 'group': group,
+            'text': text, 'image': image or None, 'comment_count': comments,
+        }
+    comments = Comment.objects.filter(author=user).order_by('pk').values_list(
+        'pk', 'created', 'post_id', 'text'
+    )
+    for pk, created, post_id, text in comments.iterator(
+        chunk_size=chunk_size
+    ):
+        yield {
+            'type': 'comment', 'id': pk, 'date': created, 'post': post_id,
+            'text': text,
+        }
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Line:
+    """Файл для csv.writer, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.DictWriter(_Line(), CSV_COLUMNS)
+    yield writer.writeheader()
+    for row in rows:
+        row['date'] = row['date'].isoformat()
+        yield writer.writerow(row)
+
+
+def export_lines(user, export_format, chunk_size):
+    """Строки выгрузки в формате ndjson или csv."""
+    rows = export_rows(user, chunk_size)
+    if export_format == 'csv':
+        return csv_lines(rows)
+    return ndjson_lines(rows)
@@ -0,0 +1,202 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q, Subquery
+from django.utils.functional import cached_property
+
+from .models import FeedEntry, Follow, Post, UserStats
+from .paginators import CursorPaginator, cursor_key
+from .routers import not_sticky
+from .tasks import task
+
+
+def is_celebrity(author_id):
+    """Проверяет, что у автора больше FEED_FANOUT_MAX подписчиков.
+    Счёт ограничен порогом, поэтому не зависит от размера аудитории."""
+    limit = settings.FEED_FANOUT_MAX
+    followers = Follow.objects.filter(author_id=author_id).order_by()
+    return followers[:limit + 1].count() > limit
+
+
+def celebrities(author_ids):
+    """Популярные авторы из author_ids одним запросом по счётчикам
+    подписчиков, для пачек при импорте."""
+    return set(UserStats.objects.filter(
+        user_id__in=author_ids,
+        followers_count__gt=settings.FEED_FANOUT_MAX
+    ).values_list('user_id', flat=True))
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты подписчиков автора. Посты
+    популярных авторов не раскладываются, а подмешиваются при чтении."""
+    if is_celebrity(post.author_id):
+        Follow.objects.filter(
+            author_id=post.author_id, fanout=True
+        ).update(fanout=False)
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers],
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту нового подписчика последние FEED_BACKFILL
+    постов автора. До этого новая подписка подмешивает посты автора
+    при чтении (fanout=False), после - они раскладываются в ленту."""
+    if is_celebrity(follow.author_id):
+        Follow.objects.filter(pk=follow.pk).update(fanout=False)
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id
+    ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=follow.user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts],
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    Follow.objects.filter(pk=follow.pk, fanout=False).update(fanout=True)
+
+
+@task
+def fan_out_post(post_id):
+    """fan_out из очереди задач; пост могли успеть удалить."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        fan_out(post)
+
+
+@task
+def backfill_follow(follow_id):
+    """backfill из очереди задач; после отписки ленту не заполняет."""
+    follow = Follow.objects.filter(pk=follow_id).first()
+    if follow is not None:
+        backfill(follow)
+
+
+def fan_out_many(posts):
+    """fan_out для пачки новых постов, например при импорте: подписчики
+    всех авторов пачки читаются одним запросом. Счётчики подписчиков
+    должны быть уже обновлены."""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    popular = celebrities(by_author)
+    Follow.objects.filter(
+        author_id__in=popular, fanout=True
+    ).update(fanout=False)
+    followers = Follow.objects.filter(
+        author_id__in=set(by_author) - popular
+    ).values_list('author_id', 'user_id')
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for author_id, user_id in followers
+         for post in by_author[author_id]],
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_many(follows):
+    """backfill для пачки новых подписок: последние посты каждого
+    автора читаются один раз для всех его новых подписчиков."""
+    by_author = defaultdict(list)
+    for follow in follows:
+        by_author[follow.author_id].append(follow.user_id)
+    popular = celebrities(by_author)
+    Follow.objects.filter(author_id__in=popular).update(fanout=False)
+    entries = []
+    for author_id, user_ids in by_author.items():
+        if author_id in popular:
+            continue
+        posts = list(Post.objects.filter(
+            author_id=author_id
+        ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL])
+        entries += [FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                    for user_id in user_ids for pk, pub_date in posts]
+    FeedEntry.objects.bulk_create(
+        entries, batch_size=settings.FEED_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def trim(follow):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    FeedEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+
+
+class FeedPaginator(CursorPaginator):
+    """Лента подписок по курсору: материализованные записи пользователя
+    плюс посты популярных авторов и авторов новых подписок, ещё
+    не разложенные задачей backfill, которые подмешиваются при чтении.
+
+    Каждый источник - свой диапазон по индексу с LIMIT: записи ленты
+    по (user, pub_date, post), посты каждого подмешиваемого автора по
+    (author, pub_date). Посты выбираются одним запросом по pk из этих
+    диапазонов и сливаются здесь же, так что база ничего не сортирует
+    и читает не больше per_page + 1 строк на источник. object_list -
+    выборка постов, например с select_related или .values()."""
+
+    def __init__(self, object_list, per_page, user, **kwargs):
+        self.user = user
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def pulled(self):
+        return list(self.user.follower.filter(
+            fanout=False
+        ).values_list('author', flat=True))
+
+    def _range(self, queryset, key, forward, pk_field):
+        sign = '-' if forward == self.descending else ''
+        if key is not None:
+            queryset = queryset.filter(self._beyond(*key, forward, pk_field))
+        return queryset.order_by(
+            f'{sign}pub_date', f'{sign}{pk_field}'
+        ).values(pk_field)[:self.per_page + 1]
+
+    def _slice(self, key, forward):
+        sources = [self._range(
+            FeedEntry.objects.filter(user=self.user), key, forward, 'post_id'
+        )] + [
+            self._range(Post.objects.filter(author_id=author_id),
+                        key, forward, 'pk')
+            for author_id in self.pulled
+        ]
+        items = self.object_list.order_by().filter(
+            reduce(or_, (Q(pk__in=source) for source in sources))
+        )
+        return sorted(
+            items, key=cursor_key, reverse=forward == self.descending
+        )[:self.per_page + 1]
+
+
+def unread_count(user, limit):
+    """Число постов авторов из подписок новее отметки feed_seen, но не
+    больше limit: на каждого автора - диапазон по индексу
+    (author, pub_date), COUNT по подзапросу с LIMIT."""
+    seen = UserStats.objects.filter(user=user).values('feed_seen')
+    return Post.objects.filter(
+        author__in=user.follower.values('author'),
+        pub_date__gt=Subquery(seen)
+    ).order_by()[:limit].count()
+
+
+def mark_seen(user, newest):
+    """Сдвигает отметку просмотра ленты вперёд до даты newest. Запись
+    идёт, только если появилось что-то новое, и делается при GET,
+    поэтому не закрепляет читателя за основной базой."""
+    with not_sticky():
+        UserStats.objects.filter(
+            user=user, feed_seen__lt=newest
+        ).update(feed_seen=newest)
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш в памяти процесса со сроком жизни
+    записей и ограничением по числу записей и суммарному размеру."""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _pop(self, key):
+        _, size, _ = self._data.pop(key)
+        self.size -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        size = len(key) + len(value)
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+            while (len(self._data) > self.max_entries
+                   or self.size > self.max_bytes):
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._data),
+                'bytes': self.size,
+            }
+
+
+class LRUKVStore(KVStore):
+    """kvstore sorl.thumbnail с LRU-слоем в памяти процесса перед
+    кэшем Django и таблицей в базе. Отсутствующие ключи в LRU
+    не запоминаются, чтобы готовая миниатюра появилась сразу."""
+
+    def __init__(self):
+        super().__init__()
+        self.lru = LRUCache(
+            settings.THUMBNAIL_LRU_MAX_ENTRIES,
+            settings.THUMBNAIL_LRU_MAX_BYTES,
+            settings.THUMBNAIL_LRU_TTL,
+        )
+
+    def _get_raw(self, key):
+        value = self.lru.get(key)
+        if value is None:
+            value = super()._get_raw(key)
+            if value is not None:
+                self.lru.set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.lru.set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        for key in keys:
+            self.lru.delete(key)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.lru.clear()
+
+    def prefetch(self, image_files):
+        """Загружает записи для всех image_files разом: одним get_many
+        из кэша Django и одним запросом к базе для оставшихся."""
+        keys = {add_prefix(image_file.key) for image_file in image_files}
+        missing = [key for key in keys if self.lru.get(key) is None]
+        if not missing:
+            return
+        found = self.cache.get_many(missing)
+        rest = [key for key in missing if key not in found]
+        if rest:
+            rows = dict(KVStoreModel.objects.filter(
+                key__in=rest
+            ).values_list('key', 'value'))
+            for key in rest:
+                found[key] = rows.get(key, EMPTY_VALUE)
+            self.cache.set_many(
+                {key: found[key] for key in rest},
+                sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+        for key, value in found.items():
+            if value != EMPTY_VALUE:
+                self.lru.set(key, value)
@@ -0,0 +1,66 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Сводка журнала медленных запросов: места, где запросы '
+            'отнимают больше всего времени, - view, шаблон со строкой '
+            'и текст запроса.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', nargs='?',
+                            help='Файл журнала, по умолчанию '
+                                 'SLOW_QUERY_LOG_FILE.')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--kind', choices=('slow', 'repeated'),
+                            help='Только медленные или только '
+                                 'повторяющиеся запросы.')
+
+    def handle(self, *args, **options):
+        groups = self.read(
+            options['log'] or settings.SLOW_QUERY_LOG_FILE, options['kind']
+        )
+        ranked = sorted(
+            groups.items(), key=lambda item: item[1]['ms'], reverse=True
+        )
+        for (kind, view, place, sql), total in ranked[:options['top']]:
+            self.stdout.write(
+                f'{total["ms"]:10.1f} мс  {total["entries"]:>5} раз  '
+                f'{total["queries"]:>6} запр.  {kind:<8} {view}  {place}'
+            )
+            self.stdout.write(f'    {sql}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Мест: {len(groups)}, записей: '
+            f'{sum(total["entries"] for total in groups.values())}'
+        ))
+
+    def read(self, path, kind):
+        """Складывает записи по (вид, view, шаблон:строка или код,
+        запрос): время, число записей и число запросов в них."""
+        groups = defaultdict(lambda: {'ms': 0, 'entries': 0, 'queries': 0})
+        try:
+            log = open(path, encoding='utf-8')
+        except OSError as error:
+            raise CommandError(error)
+        with log:
+            for line in log:
+                try:
+                    entry = json.loads(line)
+                    if kind and entry['kind'] != kind:
+                        continue
+                    place = (
+                        f'{entry["template"]}:{entry["line"]}'
+                        if entry['template'] else entry['code']
+                    )
+                    total = groups[
+                        entry['kind'], entry['view'], place, entry['sql']
+                    ]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                total['ms'] += entry.get('ms', 0)
+                total['entries'] += 1
+                total['queries'] += entry.get('count', 1)
+        return groups
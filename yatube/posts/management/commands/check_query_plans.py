@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from posts.api_urls import urlpatterns as api_urlpatterns
+from posts.models import Post
+from posts.query_plans import bad_steps, capture_selects
+from posts.urls import urlpatterns
+
+# Аргументы адресов posts/urls.py и posts/api_urls.py по образцовому
+# посту в группе
+ROUTES = {
+    'posts': lambda post: {},
+    'group': lambda post: {'slug': post.group.slug},
+    'new_post': lambda post: {},
+    'follow_index': lambda post: {},
+    'follow_unread': lambda post: {},
+    'search': lambda post: {},
+    'export': lambda post: {},
+    'profile': lambda post: {'username': post.author.username},
+    'post': lambda post: {'username': post.author.username,
+                          'post_id': post.pk},
+    'comments': lambda post: {'username': post.author.username,
+                              'post_id': post.pk},
+    'post_edit': lambda post: {'username': post.author.username,
+                               'id_post': post.pk},
+    'add_comment': lambda post: {'username': post.author.username,
+                                 'post_id': post.pk},
+    'profile_follow': lambda post: {'username': post.author.username},
+    'profile_unfollow': lambda post: {'username': post.author.username},
+    'api:posts': lambda post: {},
+    'api:posts_batch': lambda post: {},
+    'api:group_posts': lambda post: {'slug': post.group.slug},
+    'api:author_posts': lambda post: {'username': post.author.username},
+    'api:follow_posts': lambda post: {},
+}
+QUERY_STRINGS = {
+    'search': {'q': 'а'},
+    'api:posts_batch': {'ids': '1,2,3'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN QUERY PLAN для SQL каждой страницы '
+            'posts/urls.py и posts/api_urls.py и падает, если план '
+            'проходит всю таблицу или сортирует во временном B-дереве. '
+            'Изменения откатываются.')
+
+    def check_url(self, client, name, url, checked):
+        """Плохие шаги планов запросов страницы, ещё не вошедших
+        в checked."""
+        with capture_selects() as queries:
+            response = client.get(url, QUERY_STRINGS.get(name, {}),
+                                  HTTP_REFERER='/')
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        problems = []
+        for sql, params in queries:
+            if sql in checked:
+                continue
+            checked.add(sql)
+            for step in bad_steps(sql, params):
+                problems.append(f'{url}: {step}\n    {sql}')
+        return problems
+
+    def handle(self, *args, **options):
+        names = {pattern.name for pattern in urlpatterns}
+        names |= {f'api:{pattern.name}' for pattern in api_urlpatterns}
+        missing = names - set(ROUTES)
+        if missing:
+            raise CommandError(f'Нет аргументов для адресов: {missing}')
+        post = Post.objects.select_related('author', 'group').filter(
+            group__isnull=False
+        ).first()
+        if post is None:
+            raise CommandError('Нужен хотя бы один пост в группе.')
+        problems = []
+        checked = set()
+        with transaction.atomic():
+            client = Client()
+            client.force_login(post.author)
+            for name, kwargs in ROUTES.items():
+                url = reverse(name, kwargs=kwargs(post))
+                problems += self.check_url(client, name, url, checked)
+            transaction.set_rollback(True)
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'Плохих планов: {len(problems)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено запросов: {len(checked)}'
+        ))
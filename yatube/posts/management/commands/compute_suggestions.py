@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.suggestions import FollowGraph, store
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рекомендации «кого почитать» по графу '
+            'подписок для всех пользователей частями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int,
+                            default=settings.SUGGESTIONS_TOP)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        graph = FollowGraph.load()
+        self.stdout.write(
+            f'Граф: подписчиков {len(graph.users)}, '
+            f'подписок {len(graph.authors)}'
+        )
+        users = stored = 0
+        last_pk = 0
+        while True:
+            pks = list(User.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)[:options['chunk_size']])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            # Страница не увидит пользователя без рекомендаций
+            with transaction.atomic():
+                stored += store(graph, pks, options['top'])
+            users += len(pks)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. пользователей {users}, рекомендаций {stored}, '
+            f'{time.perf_counter() - started:.1f} с'
+        ))
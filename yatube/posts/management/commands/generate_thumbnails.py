@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts.models import Post
+from posts.thumbnails import generate
+
+
+def generate_closing(post):
+    try:
+        generate(post)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ('Создаёт миниатюры всех размеров из POST_THUMBNAILS '
+            'для существующих постов с изображениями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).only('pk', 'image').order_by('pk')
+        done = failed = 0
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                chunk = list(
+                    posts.filter(pk__gt=last_pk)[:options['chunk_size']]
+                )
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+                futures = [
+                    pool.submit(generate_closing, post) for post in chunk
+                ]
+                for post, future in zip(chunk, futures):
+                    try:
+                        future.result()
+                        done += 1
+                    except Exception as error:
+                        failed += 1
+                        self.stderr.write(f'Пост {post.pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры созданы для {done} постов, ошибок: {failed}'
+        ))
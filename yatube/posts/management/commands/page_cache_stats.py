@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.page_cache import page_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Выводит счётчики кэша страниц для анонимных посетителей.'
+
+    def handle(self, *args, **options):
+        for stat, value in page_cache_stats().items():
+            self.stdout.write(f'{stat}: {value}')
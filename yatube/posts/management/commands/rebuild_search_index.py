@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post
+from posts.search import clear_index, index_posts, optimize_index
+
+
+class Command(BaseCommand):
+    help = ('Заново строит поисковый индекс постов, читая таблицу '
+            'частями по возрастанию pk.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options['chunk_size']
+        total = 0
+        last_pk = 0
+        with transaction.atomic():
+            clear_index()
+            while True:
+                rows = list(
+                    Post.objects.filter(pk__gt=last_pk).order_by(
+                        'pk'
+                    ).values_list('pk', 'text')[:size]
+                )
+                if not rows:
+                    break
+                index_posts(rows)
+                total += len(rows)
+                last_pk = rows[-1][0]
+        optimize_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {total}'
+        ))
@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount_posts, recount_users
+from posts.models import Post
+
+User = get_user_model()
+
+
+def batches(queryset, size):
+    """Делит выборку на части по size строк по возрастанию pk."""
+    last_pk = 0
+    while True:
+        pks = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True
+            )[:size]
+        )
+        if not pks:
+            return
+        last_pk = pks[-1]
+        yield queryset.filter(pk__in=pks)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов, комментариев, подписчиков '
+            'и подписок, исправляя расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        users = sum(
+            recount_users(batch) for batch in batches(User.objects, size)
+        )
+        posts = sum(
+            recount_posts(batch) for batch in batches(Post.objects, size)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено: пользователей {users}, постов {posts}'
+        ))
@@ -0,0 +1,164 @@
+import random
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts import search
+from posts.models import Comment, FeedEntry, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Быстро заполняет базу тестовыми пользователями, группами, '
+            'постами, комментариями и подписками через bulk_create.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=1000)
+        parser.add_argument('--follows', type=int, default=500)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Зерно генератора случайных чисел.')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        prefix = f'seed{uuid.uuid4().hex[:6]}'
+        with transaction.atomic():
+            users = self.create_users(prefix, options['users'])
+            groups = self.create_groups(prefix, options['groups'])
+            posts = self.create_posts(users, groups, options['posts'])
+            follows = self.create_follows(users, options['follows'])
+            comments = self.create_comments(
+                users, posts, options['comments']
+            )
+            self.fill_derived(users, posts, follows, comments)
+            self.index(posts)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, групп {len(groups)}, '
+            f'постов {len(posts)}, подписок {len(follows)}, '
+            f'комментариев {sum(comments.values())}'
+        ))
+
+    def bulk(self, model, objects):
+        """bulk_create частями не больше batch_size и не больше,
+        чем допускает база за один INSERT."""
+        objects = list(objects)
+        limit = connection.ops.bulk_batch_size(
+            model._meta.concrete_fields, objects
+        )
+        model.objects.bulk_create(
+            objects, batch_size=max(min(self.batch_size, limit), 1)
+        )
+
+    def create_users(self, prefix, amount):
+        password = make_password(None)
+        self.bulk(User, (
+            User(username=f'{prefix}_{i}', password=password)
+            for i in range(amount)
+        ))
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).values_list('pk', flat=True))
+
+    def create_groups(self, prefix, amount):
+        self.bulk(Group, (
+            Group(title=f'Группа {i}', slug=f'{prefix}-{i}',
+                  description=f'Описание группы {i}')
+            for i in range(amount)
+        ))
+        return list(Group.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).values_list('pk', flat=True))
+
+    def create_posts(self, users, groups, amount):
+        """Создаёт посты, возвращает список (pk, author_id, pub_date)."""
+        if not users:
+            return []
+        choices = groups + [None]
+        self.bulk(Post, (
+            Post(text=f'Пост {i}', author_id=self.random.choice(users),
+                 group_id=self.random.choice(choices))
+            for i in range(amount)
+        ))
+        return list(Post.objects.filter(
+            author_id__in=users
+        ).values_list('pk', 'author_id', 'pub_date'))
+
+    def create_follows(self, users, amount):
+        """Создаёт различные подписки, возвращает пары
+        (user_id, author_id)."""
+        amount = min(amount, len(users) * (len(users) - 1))
+        pairs = set()
+        while len(pairs) < amount:
+            user, author = self.random.sample(users, 2)
+            pairs.add((user, author))
+        self.bulk(Follow, (
+            Follow(user_id=user, author_id=author) for user, author in pairs
+        ))
+        return pairs
+
+    def create_comments(self, users, posts, amount):
+        """Создаёт комментарии, возвращает их число по постам."""
+        counts = Counter()
+        if not posts:
+            return counts
+        objects = []
+        for i in range(amount):
+            post_id = self.random.choice(posts)[0]
+            counts[post_id] += 1
+            objects.append(Comment(post_id=post_id, text=f'Комментарий {i}',
+                                   author_id=self.random.choice(users)))
+        self.bulk(Comment, objects)
+        return counts
+
+    def fill_derived(self, users, posts, follows, comments):
+        """Заполняет данные, которые обычно ведут сигналы: счётчики
+        и материализованные ленты подписок."""
+        by_author = defaultdict(list)
+        for pk, author_id, pub_date in sorted(
+            posts, key=lambda post: (post[2], post[0]), reverse=True
+        ):
+            by_author[author_id].append((pk, pub_date))
+        followers = Counter(author for _, author in follows)
+        following = Counter(user for user, _ in follows)
+        self.bulk(UserStats, (
+            UserStats(user_id=pk, posts_count=len(by_author[pk]),
+                      followers_count=followers[pk],
+                      following_count=following[pk])
+            for pk in users
+        ))
+        counted = [Post(pk=pk, comment_count=amount)
+                   for pk, amount in comments.items()]
+        fields = [Post._meta.pk, Post._meta.get_field('comment_count')]
+        limit = connection.ops.bulk_batch_size(fields, counted)
+        Post.objects.bulk_update(
+            counted, ['comment_count'],
+            batch_size=max(min(self.batch_size, limit), 1)
+        )
+        celebrities = {
+            author for author, amount in followers.items()
+            if amount > settings.FEED_FANOUT_MAX
+        }
+        Follow.objects.filter(author_id__in=celebrities).update(fanout=False)
+        self.bulk(FeedEntry, (
+            FeedEntry(user_id=user, post_id=pk, pub_date=pub_date)
+            for user, author in follows if author not in celebrities
+            for pk, pub_date in by_author[author][:settings.FEED_BACKFILL]
+        ))
+
+    def index(self, posts):
+        """Добавляет посты в поисковый индекс частями по batch_size."""
+        pks = sorted(pk for pk, *_ in posts)
+        for start in range(0, len(pks), self.batch_size):
+            search.index_posts(Post.objects.filter(
+                pk__in=pks[start:start + self.batch_size]
+            ).values_list('pk', 'text'))
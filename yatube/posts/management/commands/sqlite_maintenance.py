@@ -0,0 +1,110 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Значения PRAGMA auto_vacuum
+AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def _pragma(cursor, name):
+    cursor.execute(f'PRAGMA {name}')
+    return cursor.fetchone()[0]
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class Command(BaseCommand):
+    help = ('Обслуживание базы SQLite: ANALYZE, инкрементальный VACUUM '
+            'и контрольная точка WAL, с отчётом о сделанном.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--pages', type=int, default=0,
+            help='Сколько свободных страниц вернуть, 0 - все.'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Включить auto_vacuum=incremental и пересобрать базу '
+                 'VACUUM; база блокируется на всё время сборки.'
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(
+                f'База {options["database"]} - не SQLite'
+            )
+        with connection.cursor() as cursor:
+            self.analyze(cursor)
+            self.vacuum(
+                cursor, connection.connection, options['pages'],
+                options['full']
+            )
+            self.checkpoint(cursor, connection.settings_dict['NAME'])
+
+    def analyze(self, cursor):
+        started = time.perf_counter()
+        cursor.execute('ANALYZE')
+        cursor.execute('SELECT count(*) FROM sqlite_stat1')
+        tables = cursor.fetchone()[0]
+        self.stdout.write(
+            f'ANALYZE: статистика по {tables} индексам и таблицам, '
+            f'{time.perf_counter() - started:.2f} с'
+        )
+
+    def vacuum(self, cursor, raw_connection, pages, full):
+        page_size = _pragma(cursor, 'page_size')
+        before = _pragma(cursor, 'freelist_count')
+        mode = AUTO_VACUUM[_pragma(cursor, 'auto_vacuum')]
+        if full:
+            # Режим auto_vacuum меняется только полной пересборкой
+            cursor.execute('PRAGMA auto_vacuum = incremental')
+            cursor.execute('VACUUM')
+            action = f'VACUUM, auto_vacuum: {mode} -> incremental'
+        elif mode == 'incremental':
+            # Страница освобождается на каждом шаге выполнения PRAGMA,
+            # а execute делает только первый шаг; executescript - все
+            raw_connection.executescript(
+                f'PRAGMA incremental_vacuum({pages});'
+            )
+            action = 'incremental_vacuum'
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'VACUUM: пропущен, auto_vacuum={mode}, свободных страниц '
+                f'{before}; запустите с --full, чтобы включить '
+                f'инкрементальный режим'
+            ))
+            return
+        after = _pragma(cursor, 'freelist_count')
+        self.stdout.write(
+            f'{action}: свободных страниц {before} -> {after}, '
+            f'освобождено {(before - after) * page_size // 1024} КБ'
+        )
+
+    def checkpoint(self, cursor, name):
+        mode = _pragma(cursor, 'journal_mode')
+        if mode != 'wal':
+            self.stdout.write(f'Контрольная точка: пропущена, '
+                              f'journal_mode={mode}')
+            return
+        wal = f'{name}-wal'
+        before = _size(wal)
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        busy, log, checkpointed = cursor.fetchone()
+        if busy:
+            status = self.style.WARNING('база занята, перенесено не всё')
+        else:
+            status = self.style.SUCCESS('готово')
+        self.stdout.write(
+            f'Контрольная точка: {status}, страниц в журнале {log}, '
+            f'перенесено {checkpointed}; размер WAL {before // 1024} -> '
+            f'{_size(wal) // 1024} КБ, база {_size(name) // 1024} КБ'
+        )
@@ -0,0 +1,79 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count
+
+from posts.models import Task
+from posts.tasks import purge, work
+
+
+def _run(stop, burst):
+    try:
+        work(stop, burst)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Выполняет задачи фоновой очереди в TASK_WORKERS потоках '
+            'или процессах до SIGINT/SIGTERM.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            help='По умолчанию TASK_WORKERS.')
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Процессы вместо потоков, для задач, которые '
+                 'нагружают процессор.'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда доступных задач не останется.'
+        )
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'] or settings.TASK_WORKERS, 1)
+        purged = purge()
+        if options['processes']:
+            context = multiprocessing.get_context('fork')
+            stop, start = context.Event(), context.Process
+            # Соединение с базой нельзя унести в дочерний процесс
+            connections.close_all()
+        else:
+            stop, start = threading.Event(), threading.Thread
+
+        def shutdown(signum, frame):
+            # Начатые задачи дорабатываются, новые не берутся
+            stop.set()
+
+        previous = {
+            signum: signal.signal(signum, shutdown)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        kind = 'процессов' if options['processes'] else 'потоков'
+        self.stdout.write(
+            f'Исполнителей: {workers} {kind}, удалено старых задач: {purged}'
+        )
+        pool = [
+            start(target=_run, args=(stop, options['burst']))
+            for _ in range(workers)
+        ]
+        try:
+            for worker in pool:
+                worker.start()
+            for worker in pool:
+                worker.join()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        states = dict(Task.objects.values_list('state').annotate(
+            count=Count('pk')
+        ).order_by())
+        self.stdout.write(self.style.SUCCESS(
+            f'Остановлено. В очереди {states.get(Task.QUEUED, 0)}, '
+            f'не выполнено {states.get(Task.FAILED, 0)}'
+        ))
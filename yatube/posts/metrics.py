@@ -0,0 +1,306 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+from sorl.thumbnail import default as thumbnail_default
+
+PREFIX = 'yatube_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (1, 2, 5, 10, 20, 50, 100)
+BYTES = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Имя, тип, границы корзин гистограммы и описание каждой метрики
+METRICS = {
+    'requests_total': (
+        'counter', None, 'Ответы по маршруту, методу и статусу.'
+    ),
+    'request_duration_seconds': (
+        'histogram', SECONDS, 'Время ответа целиком.'
+    ),
+    'db_queries': (
+        'histogram', QUERIES, 'Число SQL-запросов на ответ.'
+    ),
+    'db_duration_seconds': (
+        'histogram', SECONDS, 'Время SQL-запросов на ответ.'
+    ),
+    'template_duration_seconds': (
+        'histogram', SECONDS, 'Время отрисовки шаблонов на ответ.'
+    ),
+    'response_size_bytes': (
+        'histogram', BYTES, 'Размер тела ответа.'
+    ),
+    'thumbnail_lru_lookups_total': (
+        'counter', None, 'Обращения к LRU kvstore миниатюр по исходу.'
+    ),
+    'thumbnail_lru_evictions_total': (
+        'counter', None, 'Вытеснения из LRU kvstore миниатюр.'
+    ),
+    'thumbnail_lru_entries': (
+        'gauge', None, 'Записи в LRU kvstore миниатюр.'
+    ),
+    'thumbnail_lru_bytes': (
+        'gauge', None, 'Размер записей в LRU kvstore миниатюр.'
+    ),
+}
+
+
+def thumbnail_lru():
+    """Счётчики LRU-слоя kvstore миниатюр на момент снимка."""
+    lru = getattr(thumbnail_default.kvstore, 'lru', None)
+    if lru is None:
+        return []
+    stats = lru.stats()
+    return [
+        ['thumbnail_lru_lookups_total', (('result', 'hit'),), stats['hits']],
+        ['thumbnail_lru_lookups_total', (('result', 'miss'),),
+         stats['misses']],
+        ['thumbnail_lru_evictions_total', (), stats['evictions']],
+        ['thumbnail_lru_entries', (), stats['entries']],
+        ['thumbnail_lru_bytes', (), stats['bytes']],
+    ]
+
+
+class Registry:
+    """Метрики процесса: счётчики и гистограммы по меткам и значения,
+    которые collectors снимают с других объектов в момент снимка.
+    С METRICS_DIR каждый процесс раз в METRICS_FLUSH_SECONDS пишет снимок
+    в свой файл, а выгрузка складывает файлы всех процессов."""
+
+    def __init__(self, collectors=()):
+        self.collectors = collectors
+        self.lock = threading.Lock()
+        self.flushed = 0
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # (метрика, метки) -> значение счётчика или
+            # [счётчики корзин..., +Inf, сумма]
+            self.values = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][1]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            row = self.values.setdefault(key, [0] * (len(buckets) + 2))
+            row[bisect_left(buckets, value)] += 1
+            row[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            rows = [
+                [name, labels, value] for (name, labels), value
+                in self.values.items()
+            ]
+        for collector in self.collectors:
+            rows += collector()
+        return rows
+
+    def path(self):
+        return os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+
+    def flush(self, force=False):
+        """Пишет снимок процесса в METRICS_DIR, не чаще раза
+        в METRICS_FLUSH_SECONDS. Файл подменяется целиком, читатель
+        не увидит его недописанным."""
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_SECONDS:
+            return
+        self.flushed = now
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        temporary = f'{self.path()}.tmp'
+        with open(temporary, 'w') as snapshot:
+            json.dump(self.snapshot(), snapshot)
+        os.replace(temporary, self.path())
+
+    def collect(self):
+        """Значения всех процессов: свой снимок и файлы остальных."""
+        if not settings.METRICS_DIR:
+            return self.snapshot()
+        self.flush(force=True)
+        rows = []
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            try:
+                with open(path) as snapshot:
+                    rows += json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+        return rows
+
+
+registry = Registry(collectors=[thumbnail_lru])
+_current = threading.local()
+
+
+def _merge(rows):
+    merged = {}
+    for name, labels, value in rows:
+        key = (name, tuple(tuple(label) for label in labels))
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(value, list):
+            merged[key] = [a + b for a, b in zip(merged[key], value)]
+        else:
+            merged[key] += value
+    return merged
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def exposition(rows):
+    """Текст в формате Prometheus: счётчики, значения и гистограммы
+    с накопленными корзинами, _sum и _count. Значения процессов
+    складываются, как и счётчики."""
+    merged = _merge(rows)
+    lines = []
+    for name, (kind, buckets, description) in METRICS.items():
+        series = sorted(
+            (labels, value) for (metric, labels), value in merged.items()
+            if metric == name
+        )
+        full_name = PREFIX + name
+        lines += [f'# HELP {full_name} {description}',
+                  f'# TYPE {full_name} {kind}']
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f'{full_name}{_labels(labels)} {value}')
+                continue
+            total = 0
+            for bound, count in zip((*buckets, '+Inf'), value[:-1]):
+                total += count
+                lines.append(
+                    f'{full_name}_bucket{_labels(labels, le=bound)} {total}'
+                )
+            lines.append(f'{full_name}_sum{_labels(labels)} {value[-1]}')
+            lines.append(f'{full_name}_count{_labels(labels)} {total}')
+    return '\n'.join(lines) + '\n'
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            if hasattr(_current, 'templates'):
+                _current.templates += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django, которые считают время отрисовки для метрик.
+    Вложенные include отрисовывает сам движок, их время входит
+    во время внешнего шаблона и не считается дважды."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self
+        )
+
+
+def _counted(content, route):
+    """Отдаёт потоковое тело дальше и записывает его размер, когда
+    поток закончится."""
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    registry.observe('response_size_bytes', {'route': route}, size)
+
+
+class MetricsMiddleware:
+    """Записывает для каждого ответа время, число и время SQL-запросов,
+    время шаблонов и размер тела с меткой маршрута - имени из urls."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = {'count': 0, 'seconds': 0}
+
+        def timer(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries['count'] += 1
+                queries['seconds'] += time.perf_counter() - started
+
+        _current.templates = 0
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            templates = _current.templates
+            del _current.templates
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        labels = {'route': route}
+        registry.inc('requests_total', {
+            **labels, 'method': request.method,
+            'status': str(response.status_code),
+        })
+        registry.observe('request_duration_seconds', labels, duration)
+        registry.observe('db_queries', labels, queries['count'])
+        registry.observe('db_duration_seconds', labels, queries['seconds'])
+        registry.observe('template_duration_seconds', labels, templates)
+        # Файлы отдаются с Content-Length: обёртка над потоком помешала
+        # бы серверу отправить их через wsgi.file_wrapper
+        if response.has_header('Content-Length'):
+            registry.observe(
+                'response_size_bytes', labels,
+                int(response['Content-Length'])
+            )
+        elif response.streaming:
+            response.streaming_content = _counted(
+                response.streaming_content, route
+            )
+        else:
+            registry.observe(
+                'response_size_bytes', labels, len(response.content)
+            )
+        registry.flush()
+        return response
+
+
+def metrics(request):
+    """Метрики всех процессов в текстовом формате Prometheus,
+    только для сотрудников."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(
+        exposition(registry.collect()), content_type=CONTENT_TYPE
+    )
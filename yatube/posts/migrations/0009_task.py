@@ -0,0 +1,43 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='функция')),
+                ('kwargs', models.TextField(default='{}', verbose_name='аргументы')),
+                ('key', models.CharField(blank=True, max_length=200, null=True, verbose_name='ключ')),
+                ('state', models.CharField(choices=[('queued', 'в очереди'), ('running', 'выполняется'), ('done', 'выполнена'), ('failed', 'не выполнена')], default='queued', max_length=10, verbose_name='состояние')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='попыток')),
+                ('max_attempts', models.PositiveIntegerField(verbose_name='наибольшее число попыток')),
+                ('run_at', models.DateTimeField(verbose_name='выполнить после')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='занята до')),
+                ('locked_by', models.CharField(blank=True, max_length=200, verbose_name='исполнитель')),
+                ('error', models.TextField(blank=True, verbose_name='последняя ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='создана')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='завершена')),
+            ],
+            options={
+                'verbose_name': 'задача',
+                'verbose_name_plural': 'задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['state', 'run_at'], name='posts_task_state_e5ece7_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(state='queued'), fields=('key',), name='No_repeat_queued_tasks'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:31
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='feed_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='лента просмотрена до'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feedentry_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='версия ленты'),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='posts_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='версия ленты постов'),
+        ),
+    ]
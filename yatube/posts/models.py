@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -10,6 +11,10 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=20, unique=True)
     description = models.TextField()
+    # Растёт при любом изменении постов группы, входит в ETag страницы
+    version = models.PositiveIntegerField(
+        'версия ленты', default=0, editable=False
+    )
 
     class Meta:
         verbose_name = 'группа'
@@ -29,11 +34,24 @@ class Post(models.Model):
     group = models.ForeignKey(Group, on_delete=models.SET_NULL,
                               related_name='posts', blank=True, null=True)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(
+        'число комментариев', default=0, editable=False
+    )
+    version = models.PositiveIntegerField(
+        'версия карточки', default=0, editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'пост'
         verbose_name_plural = 'посты'
+        # Ленты выводятся по (-pub_date, -pk): pk SQLite хранит в конце
+        # каждого индекса, обратный проход по ним даёт нужный порядок
+        indexes = [
+            models.Index(fields=['pub_date']),
+            models.Index(fields=['author', 'pub_date']),
+            models.Index(fields=['group', 'pub_date']),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -52,6 +70,9 @@ class Comment(models.Model):
         ordering = ('-post', 'created',)
         verbose_name = 'комментарий'
         verbose_name_plural = 'комментарии'
+        indexes = [
+            models.Index(fields=['post', 'created']),
+        ]
 
 
 class Follow(models.Model):
@@ -60,6 +81,9 @@ class Follow(models.Model):
                                related_name='following')
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              related_name='follower')
+    fanout = models.BooleanField(
+        'посты автора раскладываются в ленту подписчика', default=True
+    )
 
     class Meta:
         ordering = ('author',)
@@ -69,3 +93,126 @@ class Follow(models.Model):
                 name='No_repeat_follows'
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'fanout']),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок: пост автора,
+    разложенный в ленту подписчика при публикации."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='feed_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='feed_entries')
+    # Копия даты поста: страница ленты - диапазон по индексу
+    # (user, pub_date, post) без обращения к постам и без сортировки
+    pub_date = models.DateTimeField('дата публикации поста')
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='No_repeat_feed_entries'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post']),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя: число постов, подписчиков и подписок.
+    Обновляются сигналами при записи Post и Follow."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                related_name='stats')
+    posts_count = models.PositiveIntegerField('постов', default=0)
+    followers_count = models.PositiveIntegerField('подписчиков', default=0)
+    following_count = models.PositiveIntegerField('подписок', default=0)
+    # Дата самого нового поста, который пользователь видел в ленте
+    # подписок; всё, что новее, считается непрочитанным
+    feed_seen = models.DateTimeField(
+        'лента просмотрена до', default=timezone.now
+    )
+    # Растёт при любом изменении постов пользователя, входит в ETag
+    # профиля
+    posts_version = models.PositiveIntegerField(
+        'версия ленты постов', default=0
+    )
+
+    class Meta:
+        verbose_name = 'статистика пользователя'
+        verbose_name_plural = 'статистика пользователей'
+
+
+class Task(models.Model):
+    """Задача фоновой очереди (posts/tasks.py): функция, её аргументы
+    в JSON и состояние. Выполняет команда task_worker."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATES = (
+        (QUEUED, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (DONE, 'выполнена'),
+        (FAILED, 'не выполнена'),
+    )
+    name = models.CharField('функция', max_length=200)
+    kwargs = models.TextField('аргументы', default='{}')
+    key = models.CharField('ключ', max_length=200, blank=True, null=True)
+    state = models.CharField(
+        'состояние', max_length=10, choices=STATES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField('попыток', default=0)
+    max_attempts = models.PositiveIntegerField('наибольшее число попыток')
+    run_at = models.DateTimeField('выполнить после')
+    locked_until = models.DateTimeField('занята до', blank=True, null=True)
+    locked_by = models.CharField('исполнитель', max_length=200, blank=True)
+    error = models.TextField('последняя ошибка', blank=True)
+    created = models.DateTimeField('создана', auto_now_add=True)
+    finished = models.DateTimeField('завершена', blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'задача'
+        verbose_name_plural = 'задачи'
+        # Пока задача ждёт в очереди, вторая с тем же ключом не ставится;
+        # начатая уже не мешает поставить новую
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'], condition=models.Q(state='queued'),
+                name='No_repeat_queued_tasks'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['state', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.get_state_display()})'
+
+
+class Suggestion(models.Model):
+    """Автор, на которого стоит подписаться пользователю: его читают
+    те, кого читает пользователь, или он просто популярен. Заранее
+    считается командой compute_suggestions."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='suggestions')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='suggested_to')
+    score = models.PositiveIntegerField('общих подписок', default=0)
+    rank = models.PositiveSmallIntegerField('место')
+
+    class Meta:
+        verbose_name = 'рекомендация'
+        verbose_name_plural = 'рекомендации'
+        # Рекомендации пользователя читаются одним проходом по индексу
+        # (user, rank) в нужном порядке
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'rank'],
+                name='No_repeat_suggestion_ranks'
+            )
+        ]
@@ -0,0 +1,104 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .routers import primary_reads
+
+GENERATION_KEY = 'pagegen:{}'
+PAGE_KEY = 'anonpage:{}'
+STATS_KEY = 'anonpage:stats:{}'
+STATS = ('hits', 'misses', 'invalidations')
+
+
+def _count(stat, amount=1):
+    key = STATS_KEY.format(stat)
+    if not cache.add(key, amount, None):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+
+
+def page_cache_stats():
+    """Счётчики попаданий, промахов и сбросов кэша страниц."""
+    values = cache.get_many([STATS_KEY.format(stat) for stat in STATS])
+    return {stat: values.get(STATS_KEY.format(stat), 0) for stat in STATS}
+
+
+def _generations(scopes):
+    """Текущие поколения областей. Пропавшее из кэша поколение
+    заводится заново от текущего времени, чтобы не совпасть
+    со старым."""
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+        _count('invalidations')
+
+
+def invalidate(*scopes):
+    """Сбрасывает закэшированные страницы областей, например
+    invalidate('all', 'author:leo'). Поколения растут сразу и ещё раз
+    после фиксации транзакции, чтобы страница, собранная из данных
+    до фиксации, тоже не осталась в кэше."""
+    scopes = [scope for scope in scopes if scope]
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def post_scopes(post):
+    """Области кэша страниц, на которых виден пост."""
+    group = post.group.slug if post.group_id else None
+    return 'all', f'author:{post.author.username}', group and f'group:{group}'
+
+
+def cache_anonymous(*scopes):
+    """Кэширует GET-ответы анонимным посетителям по адресу, строке
+    запроса и поколениям областей scopes. Области - шаблоны строк,
+    подставляются аргументы из адреса: 'author:{username}'. Страница
+    для кэша собирается из основной базы, не с реплики."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            names = [scope.format(**kwargs) for scope in scopes]
+            raw = '|'.join([
+                request.path, request.META.get('QUERY_STRING', ''),
+                *names, *map(str, _generations(names)),
+            ])
+            key = PAGE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+            cached = cache.get(key)
+            if cached is not None:
+                _count('hits')
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            _count('misses')
+            with primary_reads():
+                response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(
+                    key,
+                    (response.content, response['Content-Type']),
+                    settings.ANON_PAGE_CACHE_TIMEOUT
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,145 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+# Первичные ключи - знаковые 64-битные целые; большее число SQLite
+# не примет, и запрос упадёт с OverflowError
+ID_MAX = 2 ** 63 - 1
+
+
+def cursor_key(item, date_field='pub_date'):
+    """Ключ (дата, id) элемента - экземпляра модели или словаря
+    из .values() с ключами date_field и id."""
+    if isinstance(item, dict):
+        return item[date_field], item['id']
+    return getattr(item, date_field), item.pk
+
+
+def encode_cursor(direction, item, date_field='pub_date'):
+    """Упаковывает направление и ключ (дата, id) элемента в непрозрачную
+    строку для адреса страницы."""
+    date, pk = cursor_key(item, date_field)
+    raw = json.dumps([direction, date.isoformat(), pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор, возвращает (direction, дата, id)
+    или None, если курсор повреждён."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, pub_date, pk = json.loads(
+            base64.urlsafe_b64decode(padded.encode()).decode()
+        )
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (TypeError, ValueError, OverflowError, binascii.Error):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return None
+    if not -ID_MAX - 1 <= pk <= ID_MAX:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (дата, id): каждая страница
+    выбирается одним запросом с LIMIT, без COUNT(*) и OFFSET, поэтому
+    стоимость не зависит от глубины страницы. По умолчанию - посты
+    от новых к старым, для комментариев - date_field='created'
+    и descending=False."""
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 descending=True, **kwargs):
+        self.date_field = date_field
+        self.descending = descending
+        sign = '-' if descending else ''
+        super().__init__(
+            object_list.order_by(f'{sign}{date_field}', f'{sign}pk'),
+            per_page, **kwargs
+        )
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    @cached_property
+    def num_pages(self):
+        """Известны только соседние страницы, поэтому общее число
+        страниц не считается."""
+        return 1 + bool(self.previous_cursor) + bool(self.next_cursor)
+
+    def _beyond(self, date, pk, forward, pk_field='pk'):
+        """Условие на элементы после ключа (forward) или до него
+        в порядке вывода; pk_field - поле с id элемента."""
+        lookup = 'lt' if forward == self.descending else 'gt'
+        field = self.date_field
+        return (Q(**{f'{field}__{lookup}': date})
+                | Q(**{field: date, f'{pk_field}__{lookup}': pk}))
+
+    def _slice(self, key, forward):
+        """До per_page + 1 элементов после ключа key (дата, id)
+        в порядке вывода (forward) или до него в обратном порядке,
+        без ключа - с начала."""
+        items = self.object_list
+        if key is not None:
+            items = items.filter(self._beyond(*key, forward))
+        if not forward:
+            items = items.reverse()
+        return list(items[:self.per_page + 1])
+
+    def get_page(self, cursor):
+        """Возвращает страницу по курсору, при пустом или
+        повреждённом курсоре - первую страницу."""
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return self._cursor_page(self._slice(None, True), after=None)
+        direction, date, pk = decoded
+        if direction == NEXT:
+            return self._cursor_page(
+                self._slice((date, pk), True), after=True
+            )
+        items = self._slice((date, pk), False)
+        if len(items) <= self.per_page:
+            return self._cursor_page(self._slice(None, True), after=None)
+        items = items[:self.per_page][::-1]
+        return self._make_page(items, has_previous=True, has_next=True)
+
+    def _cursor_page(self, items, after):
+        has_next = len(items) > self.per_page
+        return self._make_page(
+            items[:self.per_page],
+            has_previous=bool(after),
+            has_next=has_next
+        )
+
+    def _make_page(self, items, has_previous, has_next):
+        if items and has_next:
+            self.next_cursor = encode_cursor(
+                NEXT, items[-1], self.date_field
+            )
+        if items and has_previous:
+            self.previous_cursor = encode_cursor(
+                PREVIOUS, items[0], self.date_field
+            )
+        return Page(items, 1 + bool(self.previous_cursor), self)
+
+
+def paginate(request, queryset):
+    """Выбирает режим постраничного вывода: небольшие ленты (не более
+    PAGE_NUMBERED_MAX постов) выводятся с номерами страниц, остальные
+    и любые запросы с параметром cursor - по курсору."""
+    cursor = request.GET.get('cursor')
+    if cursor is None:
+        size = queryset.order_by()[:settings.PAGE_NUMBERED_MAX + 1].count()
+        if size <= settings.PAGE_NUMBERED_MAX:
+            paginator = Paginator(queryset, settings.PAGE_MAX)
+            paginator.count = size
+            return paginator.get_page(request.GET.get('page'))
+    return CursorPaginator(queryset, settings.PAGE_MAX).get_page(cursor)
@@ -0,0 +1,46 @@
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+
+# Проход по индексу (SCAN ... USING INDEX) допустим: он идёт в нужном
+# порядке и обрывается по LIMIT. Проход по производной таблице subquery
+# ограничен самим подзапросом
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+@contextmanager
+def capture_selects():
+    """Собирает (sql, params) всех SELECT, выполненных внутри блока."""
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield queries
+
+
+def explain(sql, params):
+    """Шаги плана EXPLAIN QUERY PLAN для запроса."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def bad_steps(sql, params):
+    """Шаги плана с сортировкой во временном B-дереве или с полным
+    проходом по таблице в запросе с условием WHERE. Запрос без WHERE
+    и так читает всю таблицу, например список групп для формы."""
+    filtered = ' WHERE ' in sql
+    bad = []
+    for step in explain(sql, params):
+        scan = SCAN.match(step)
+        if TEMP_SORT in step or (
+            scan and filtered and scan.group(1) != 'subquery'
+        ):
+            bad.append(step)
+    return bad
@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Время, до которого чтения пользователя идут в основную базу
+COOKIE = 'primary_until'
+# Сессия читается сразу после входа, её всегда берём из основной базы
+PRIMARY_APPS = ('sessions',)
+_state = threading.local()
+
+
+class ReplicaRouter:
+    """Запись - в основную базу, чтение в запросе - в одну из
+    DATABASE_REPLICAS. В основную базу идут и чтения вне запросов
+    (команды, фоновые потоки), внутри transaction.atomic, в запросах,
+    которые пишут, и у пользователя, который недавно писал."""
+
+    def db_for_read(self, model, **hints):
+        if (not settings.DATABASE_REPLICAS
+                or not getattr(_state, 'in_request', False)
+                or _state.primary
+                or model._meta.app_label in PRIMARY_APPS
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if getattr(_state, 'in_request', False):
+            # Остаток запроса читает то, что сам записал
+            _state.primary = _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Все базы - копии одной: объект с реплики можно связать
+        с объектом из основной базы."""
+        return True
+
+
+@contextmanager
+def primary_reads():
+    """Чтения внутри блока идут в основную базу, например когда
+    страница собирается для общего кэша: собранная с отстающей реплики,
+    она осталась бы в кэше под новым поколением."""
+    previous = getattr(_state, 'primary', False)
+    _state.primary = True
+    try:
+        yield
+    finally:
+        _state.primary = previous or getattr(_state, 'wrote', False)
+
+
+@contextmanager
+def not_sticky():
+    """Записи внутри блока не закрепляют пользователя за основной
+    базой cookie: для служебных отметок, которые он не перечитывает
+    в следующих запросах. Остаток текущего запроса читает основную
+    базу, как после любой записи."""
+    wrote = getattr(_state, 'wrote', False)
+    try:
+        yield
+    finally:
+        _state.wrote = wrote
+
+
+def _sticky(request):
+    try:
+        return float(request.COOKIES.get(COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaMiddleware:
+    """Отмечает границы запроса для ReplicaRouter. После записи ставит
+    cookie, с которой REPLICA_STICKY_SECONDS чтения пользователя идут
+    в основную базу: реплика может ещё не получить его пост
+    или комментарий."""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.in_request = True
+        _state.wrote = False
+        _state.primary = (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            or _sticky(request)
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.in_request = False
+        if wrote:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds,
+                httponly=True, samesite='Lax'
+            )
+        return response
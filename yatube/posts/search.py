@@ -0,0 +1,80 @@
+import re
+
+from django.db import connection
+
+from .models import Post
+
+# Обратный индекс текстов постов - виртуальная таблица FTS5 SQLite,
+# rowid строки совпадает с pk поста
+TABLE = 'posts_post_search'
+WORD = re.compile(r'\w+')
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Выражение MATCH из строки пользователя: каждое слово ищется
+    по началу, все слова должны встретиться в посте."""
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query.lower()))
+
+
+def search_posts(query, queryset=None):
+    """Посты со всеми словами query, самые подходящие (bm25) - первыми.
+    Без FTS5 - медленный поиск по вхождению подстроки."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not enabled():
+        for word in WORD.findall(query):
+            queryset = queryset.filter(text__icontains=word)
+        return queryset
+    # Поиск идёт от индекса: подходящие строки FTS5 соединяются с постами
+    # по rowid, bm25 считается один раз на найденную строку
+    return queryset.extra(
+        select={'rank': f'bm25({TABLE})'},
+        tables=[TABLE],
+        where=[f'{TABLE}.rowid = {Post._meta.db_table}.id',
+               f'{TABLE} MATCH %s'],
+        params=[expression],
+    ).order_by('rank', '-pub_date', '-pk')
+
+
+def index_posts(rows):
+    """Добавляет в индекс или обновляет посты из пар (pk, text)."""
+    rows = list(rows)
+    if not enabled() or not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s', [(pk,) for pk, _ in rows]
+        )
+        cursor.executemany(
+            f'INSERT INTO {TABLE}(rowid, text) VALUES (%s, %s)', rows
+        )
+
+
+def unindex_posts(pks):
+    pks = list(pks)
+    if not enabled() or not pks:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s', [(pk,) for pk in pks]
+        )
+
+
+def clear_index():
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+
+
+def optimize_index():
+    """Сливает сегменты индекса после массовой загрузки."""
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
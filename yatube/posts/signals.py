@@ -0,0 +1,167 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import feed, search
+from .counters import (bump_comments, bump_listings, bump_stats,
+                       bump_versions)
+from .models import Comment, Follow, Group, Post, Suggestion, UserStats
+from .page_cache import invalidate, post_scopes
+from .tasks import enqueue
+from .thumbnails import forget_thumbnails
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    """Заводит строку счётчиков для нового пользователя."""
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    """Учитывает новый пост в счётчиках и версиях лент и ставит
+    в очередь раскладку по лентам подписчиков, при правке поста
+    обновляет версию карточки и лент, в том числе прежней группы."""
+    if created:
+        bump_stats(instance.author_id, posts_count=1)
+        bump_listings([instance.author_id], [instance.group_id])
+        enqueue(feed.fan_out_post, post_id=instance.pk,
+                key=f'fan_out:{instance.pk}')
+    else:
+        bump_versions(Post.objects.filter(pk=instance.pk))
+        old_group = getattr(instance, '_old_group_id', None)
+        if old_group and old_group != instance.group_id:
+            bump_listings(groups=[old_group])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_stats(instance.author_id, posts_count=-1)
+    bump_listings([instance.author_id], [instance.group_id])
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, **kwargs):
+    """Обновляет пост в поисковом индексе."""
+    search.index_posts([(instance.pk, instance.text)])
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    search.unindex_posts([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, created, **kwargs):
+    """Обновляет версии карточек постов изменённой группы."""
+    if not created:
+        bump_versions(instance.posts.all())
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    """Посты удаляемой группы остаются без группы, их карточки
+    устаревают."""
+    bump_versions(instance.posts.all())
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    """Новый комментарий растит счётчик, правка (например, в админке)
+    только версию поста."""
+    bump_comments(instance.post_id, 1 if created else 0)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_comments(instance.post_id, -1)
+
+
+@receiver(pre_save, sender=Follow)
+def follow_pulled(sender, instance, **kwargs):
+    """Пока задача backfill не заполнила ленту нового подписчика,
+    посты автора подмешиваются в неё при чтении."""
+    if instance._state.adding:
+        instance.fanout = False
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """Учитывает подписку в счётчиках, ставит в очередь заполнение
+    ленты нового подписчика постами автора и убирает автора
+    из рекомендаций подписчику."""
+    if created:
+        bump_stats(instance.author_id, followers_count=1)
+        bump_stats(instance.user_id, following_count=1)
+        enqueue(feed.backfill_follow, follow_id=instance.pk,
+                key=f'backfill:{instance.pk}')
+        # Рекомендация уже принята
+        Suggestion.objects.filter(
+            user_id=instance.user_id, author_id=instance.author_id
+        ).delete()
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Учитывает отписку в счётчиках и чистит ленту."""
+    bump_stats(instance.author_id, followers_count=-1)
+    bump_stats(instance.user_id, following_count=-1)
+    feed.trim(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old(sender, instance, **kwargs):
+    """Запоминает прежние группу и изображение поста, чтобы сбросить
+    страницы старой группы и миниатюры старого изображения."""
+    old = None
+    if instance.pk:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'group__slug', 'image'
+        ).first()
+    (instance._old_group_id, instance._old_group_slug,
+     instance._old_image) = old or (None, None, None)
+
+
+@receiver(post_save, sender=Post)
+def image_changed(sender, instance, created, **kwargs):
+    old_image = getattr(instance, '_old_image', None)
+    if old_image and old_image != instance.image.name:
+        forget_thumbnails(old_image)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    old_group = getattr(instance, '_old_group_slug', None)
+    invalidate(*post_scopes(instance), old_group and f'group:{old_group}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    invalidate(*post_scopes(instance.post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    invalidate(
+        f'author:{instance.author.username}',
+        f'author:{instance.user.username}'
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    authors = User.objects.filter(
+        posts__group=instance
+    ).values_list('username', flat=True).distinct()
+    invalidate(
+        'all', f'group:{instance.slug}',
+        *[f'author:{username}' for username in authors]
+    )
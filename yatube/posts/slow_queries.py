@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DJANGO_DIR = os.path.dirname(django.__file__)
+SITE_PACKAGES = os.sep + 'site-packages' + os.sep
+
+
+def _template(frame):
+    """Шаблон и строка узла, который отрисовывался, когда выполнялся
+    запрос: ближайший вызов Node.render_annotated на стеке."""
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return origin.template_name, token.lineno
+        frame = frame.f_back
+    return None, None
+
+
+def _code(frame):
+    """Ближайшая к запросу строка кода проекта, например
+    posts/views.py:40. Обёртки execute_wrapper (метрики и этот журнал)
+    стоят ниже кадров Django и пропускаются."""
+    inside_django = False
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(DJANGO_DIR):
+            inside_django = True
+        elif (inside_django and filename.startswith(settings.BASE_DIR)
+              and SITE_PACKAGES not in filename):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+def _entry(kind, query, **fields):
+    return {
+        'time': timezone.now().isoformat(), 'kind': kind,
+        'template': query['template'], 'line': query['line'],
+        'code': query['code'], 'sql': query['sql'], **fields,
+    }
+
+
+def slow_entries(queries):
+    """Записи о медленных запросах и о запросах, повторённых
+    с одинаковым текстом SLOW_QUERY_REPEATS раз и больше (N+1)."""
+    entries = [
+        _entry('slow', query, ms=round(query['ms'], 2), count=1)
+        for query in queries if query['ms'] >= settings.SLOW_QUERY_MS
+    ]
+    same_sql = defaultdict(list)
+    for query in queries:
+        same_sql[query['sql']].append(query)
+    for repeated in same_sql.values():
+        if len(repeated) >= settings.SLOW_QUERY_REPEATS:
+            entries.append(_entry(
+                'repeated', repeated[0],
+                ms=round(sum(query['ms'] for query in repeated), 2),
+                count=len(repeated),
+            ))
+    return entries
+
+
+class SlowQueryMiddleware:
+    """Включается SLOW_QUERY_LOG. Пишет в лог posts.slow_queries по
+    JSON-строке на медленный или повторяющийся запрос: view, шаблон и
+    строка, из которых он выполнен. Сводку даёт команда
+    analyze_slow_queries."""
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def recorder(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                ms = (time.perf_counter() - started) * 1000
+                frame = sys._getframe(1)
+                template, line = _template(frame)
+                queries.append({
+                    'sql': sql, 'template': template, 'line': line,
+                    'code': _code(frame), 'ms': ms,
+                })
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        for entry in slow_entries(queries):
+            entry.update(
+                view=match._func_path if match else None,
+                route=match.view_name if match else None,
+                path=request.path,
+            )
+            logger.warning(json.dumps(entry, ensure_ascii=False))
+        return response
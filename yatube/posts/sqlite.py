@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def apply_pragmas(raw_connection, pragmas):
+    """Выполняет PRAGMA из словаря на соединении sqlite3. Настройки
+    действуют до закрытия соединения, кроме journal_mode=wal: он
+    записывается в файл базы и остаётся для всех соединений."""
+    for name, value in pragmas.items():
+        raw_connection.execute(f'PRAGMA {name} = {value}').fetchall()
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """Каждое новое соединение с SQLite получает SQLITE_PRAGMAS. С
+    CONN_MAX_AGE соединение переживает запрос, и это делается
+    один раз на поток, а не на каждый ответ."""
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.connection, settings.SQLITE_PRAGMAS)
@@ -0,0 +1,20 @@
+// Раз в минуту обновляет число новых постов ленты подписок в меню.
+// Браузер повторяет запрос с ETag, и пока число то же, сервер отвечает 304
+(function () {
+  var badge = document.getElementById('unread-posts');
+  if (!badge || !window.fetch) {
+    return;
+  }
+  function poll() {
+    fetch(badge.dataset.url, {credentials: 'same-origin', cache: 'no-cache'})
+      .then(function (response) {
+        return response.ok ? response.json() : null;
+      })
+      .then(function (data) {
+        if (data) {
+          badge.textContent = data.unread ? data.unread + (data.more ? '+' : '') : '';
+        }
+      });
+  }
+  setInterval(poll, 60000);
+})();
@@ -0,0 +1,94 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from .models import Follow, Suggestion
+
+
+class FollowGraph:
+    """Граф подписок в памяти без объекта на ребро: отсортированные id
+    подписчиков, смещения их подписок и id авторов подряд, как
+    в разреженной матрице CSR. Подписки пользователя ищутся бинарным
+    поиском по users."""
+
+    def __init__(self, edges):
+        """edges - пары (подписчик, автор), упорядоченные по подписчику."""
+        self.users = array('q')
+        self.offsets = array('q')
+        self.authors = array('q')
+        for user_id, author_id in edges:
+            if not self.users or self.users[-1] != user_id:
+                self.users.append(user_id)
+                self.offsets.append(len(self.authors))
+            self.authors.append(author_id)
+        self.offsets.append(len(self.authors))
+        self.followers = Counter(self.authors)
+        # Авторы от самых популярных - запас, когда друзей друзей мало
+        self.popular = array('q', sorted(
+            self.followers, key=lambda author: (-self.followers[author],
+                                                author)
+        ))
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        """Граф из таблицы подписок, прочитанной по уникальному индексу
+        (user, author) без сортировки и частями по chunk_size."""
+        edges = Follow.objects.order_by('user_id', 'author_id')
+        return cls(edges.values_list('user_id', 'author_id').iterator(
+            chunk_size=chunk_size
+        ))
+
+    def following(self, user_id):
+        index = bisect_left(self.users, user_id)
+        if index == len(self.users) or self.users[index] != user_id:
+            return self.authors[:0]
+        return self.authors[self.offsets[index]:self.offsets[index + 1]]
+
+    def suggest(self, user_id, top):
+        """До top пар (автор, вес): авторы, которых читают те, кого читает
+        пользователь, с весом - числом таких общих подписок; при равном
+        весе - более популярные. Недостающие места занимают самые
+        популярные авторы с весом 0."""
+        followed = set(self.following(user_id))
+        followed.add(user_id)
+        scores = Counter()
+        for middle in followed - {user_id}:
+            scores.update(self.following(middle))
+        for author in followed:
+            scores.pop(author, None)
+        best = heapq.nlargest(
+            top, scores.items(),
+            key=lambda item: (item[1], self.followers[item[0]], -item[0])
+        )
+        chosen = {author for author, _ in best}
+        for author in self.popular:
+            if len(best) >= top:
+                break
+            if author not in followed and author not in chosen:
+                best.append((author, 0))
+        return best
+
+
+def store(graph, user_ids, top):
+    """Заменяет рекомендации пользователей user_ids, возвращает число
+    записанных."""
+    rows = [
+        Suggestion(user_id=user_id, author_id=author_id, score=score,
+                   rank=rank)
+        for user_id in user_ids
+        for rank, (author_id, score) in enumerate(
+            graph.suggest(user_id, top)
+        )
+    ]
+    Suggestion.objects.filter(user_id__in=user_ids).delete()
+    Suggestion.objects.bulk_create(rows)
+    return len(rows)
+
+
+def suggestions_for(user):
+    """Рекомендации пользователя по порядку с авторами и их счётчиками
+    одним запросом по индексу (user, rank)."""
+    return Suggestion.objects.filter(user=user).select_related(
+        'author', 'author__stats'
+    ).order_by('rank')
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Имя функции -> функция; в очередь ставятся только отмеченные @task
+registry = {}
+
+
+def task(func):
+    """Разрешает ставить функцию в очередь. Аргументы передаются
+    именованными и должны сохраняться в JSON. Задача может выполниться
+    дважды (исполнитель упал или не уложился в TASK_VISIBILITY_TIMEOUT),
+    повторный запуск не должен ничего портить."""
+    registry[f'{func.__module__}.{func.__qualname__}'] = func
+    return func
+
+
+def enqueue(func, *, key=None, delay=0, max_attempts=None, **kwargs):
+    """Ставит func(**kwargs) в очередь через delay секунд и возвращает
+    задачу. Пока в очереди ждёт задача с тем же key, новая не ставится,
+    возвращается None. Запись идёт в транзакции запроса: откат запроса
+    отменяет и задачу. Без TASK_QUEUE функция выполняется сразу."""
+    name = f'{func.__module__}.{func.__qualname__}'
+    if registry.get(name) is not func:
+        raise ValueError(f'{name} не отмечена @task')
+    if not settings.TASK_QUEUE:
+        func(**kwargs)
+        return None
+    try:
+        with transaction.atomic():
+            return Task.objects.create(
+                name=name, kwargs=json.dumps(kwargs), key=key,
+                max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        return None
+
+
+def _abandoned(now):
+    """Взятые исполнителем, который не отчитался за
+    TASK_VISIBILITY_TIMEOUT."""
+    return Q(state=Task.RUNNING, locked_until__lt=now)
+
+
+def _available(now):
+    """Ждущие своего времени и брошенные, у которых остались попытки."""
+    return (Q(state=Task.QUEUED, run_at__lte=now)
+            | _abandoned(now) & Q(attempts__lt=F('max_attempts')))
+
+
+def _fail_abandoned(now):
+    """Брошенные на последней попытке задачи не выполнены: иначе
+    задачу, которая роняет исполнителя, брали бы без конца."""
+    failed = Task.objects.filter(
+        _abandoned(now), attempts__gte=F('max_attempts')
+    ).update(
+        state=Task.FAILED, locked_until=None, finished=now,
+        error='Исполнитель не отчитался о последней попытке',
+    )
+    if failed:
+        logger.error('Брошено на последней попытке задач: %s', failed)
+
+
+def claim(worker):
+    """Забирает самую давнюю доступную задачу. Состояние проверяется
+    в самом UPDATE: из двух исполнителей задачу получит один."""
+    now = timezone.now()
+    _fail_abandoned(now)
+    candidates = Task.objects.filter(_available(now)).order_by(
+        'run_at'
+    ).values_list('pk', flat=True)[:settings.TASK_CLAIM_BATCH]
+    for pk in candidates:
+        claimed = Task.objects.filter(_available(now), pk=pk).update(
+            state=Task.RUNNING, locked_by=worker, attempts=F('attempts') + 1,
+            locked_until=now + timedelta(
+                seconds=settings.TASK_VISIBILITY_TIMEOUT
+            ),
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def backoff(attempts):
+    """Пауза перед повтором: TASK_RETRY_DELAY, удваивается с каждой
+    неудачной попыткой, не больше TASK_RETRY_DELAY_MAX."""
+    return min(settings.TASK_RETRY_DELAY * 2 ** (attempts - 1),
+               settings.TASK_RETRY_DELAY_MAX)
+
+
+def _finish(task, **fields):
+    """Записывает итог, если задачу за это время не забрал другой
+    исполнитель: число попыток служит меткой владельца."""
+    return Task.objects.filter(
+        pk=task.pk, state=Task.RUNNING, attempts=task.attempts
+    ).update(locked_until=None, **fields)
+
+
+def _retry(task, error):
+    now = timezone.now()
+    if task.attempts >= task.max_attempts:
+        logger.error('Задача %s не выполнена за %s попыток: %s',
+                     task.name, task.attempts, error)
+        _finish(task, state=Task.FAILED, error=error, finished=now)
+        return
+    try:
+        with transaction.atomic():
+            _finish(task, state=Task.QUEUED, error=error,
+                    run_at=now + timedelta(seconds=backoff(task.attempts)))
+    except IntegrityError:
+        # Та же работа уже снова стоит в очереди под тем же ключом
+        _finish(task, state=Task.DONE, error=error, finished=now)
+
+
+def execute(task):
+    func = registry.get(task.name)
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача {task.name}')
+        func(**json.loads(task.kwargs))
+    except Exception:
+        _retry(task, traceback.format_exc())
+    else:
+        _finish(task, state=Task.DONE, error='', finished=timezone.now())
+
+
+def work(stop, burst=False):
+    """Цикл исполнителя: забирает задачи по одной, пока не выставлен
+    stop. Если задач нет, ждёт TASK_POLL_SECONDS, а с burst выходит."""
+    worker = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            found = claim(worker)
+            if found is None:
+                if burst:
+                    return
+                stop.wait(settings.TASK_POLL_SECONDS)
+                continue
+            execute(found)
+    finally:
+        close_old_connections()
+
+
+def purge():
+    """Удаляет выполненные задачи старше TASK_KEEP_DONE секунд,
+    невыполненные остаются для разбора."""
+    return Task.objects.filter(
+        state=Task.DONE,
+        finished__lt=timezone.now() - timedelta(
+            seconds=settings.TASK_KEEP_DONE
+        )
+    ).delete()[0]
+
+
+def run_pending():
+    """Выполняет все доступные задачи в текущем потоке и соединении,
+    например в тестах, где запись ещё не зафиксирована."""
+    work(threading.Event(), burst=True)
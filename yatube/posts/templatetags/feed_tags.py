@@ -0,0 +1,16 @@
+from django import template
+from django.conf import settings
+
+from posts.conditional import unread_posts as count_unread
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def unread_posts(context):
+    """Число новых постов ленты подписок для меню: пусто, если их нет,
+    и «99+» сверх FEED_UNREAD_MAX."""
+    unread = count_unread(context['request'])
+    if unread > settings.FEED_UNREAD_MAX:
+        return f'{settings.FEED_UNREAD_MAX}+'
+    return unread or ''
@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(PAGE_MAX=2)
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author,
+                group=cls.group if i % 2 else None
+            )
+            for i in range(5)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, **params):
+        """id постов со всех страниц ленты по курсору next."""
+        ids = []
+        while True:
+            data = self.client.get(url, params).json()
+            ids += [item['id'] for item in data['results']]
+            if not data['next']:
+                return ids
+            params['cursor'] = data['next']
+
+    def newest_first(self, posts):
+        return [post.pk for post in reversed(posts)]
+
+    def test_feeds(self):
+        self.assertEqual(
+            self.walk(reverse('api:posts')), self.newest_first(self.posts)
+        )
+        self.assertEqual(
+            self.walk(reverse('api:group_posts', args=['group'])),
+            self.newest_first(self.posts[1::2])
+        )
+        self.assertEqual(
+            self.walk(reverse('api:author_posts', args=['author'])),
+            self.newest_first(self.posts)
+        )
+        self.client.force_login(self.reader)
+        self.assertEqual(
+            self.walk(reverse('api:follow_posts')),
+            self.newest_first(self.posts)
+        )
+
+    def test_previous_cursor(self):
+        first = self.client.get(reverse('api:posts')).json()
+        second = self.client.get(
+            reverse('api:posts'), {'cursor': first['next']}
+        ).json()
+        back = self.client.get(
+            reverse('api:posts'), {'cursor': second['previous']}
+        ).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_sparse_fields(self):
+        data = self.client.get(
+            reverse('api:posts'), {'fields': 'text,author'}
+        ).json()
+        self.assertEqual(
+            data['results'][0], {'text': 'Пост 4', 'author': 'author'}
+        )
+        response = self.client.get(reverse('api:posts'), {'fields': 'email'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_all_fields(self):
+        item = self.client.get(reverse('api:posts')).json()['results'][0]
+        self.assertEqual(item['group'], None)
+        self.assertEqual(item['image'], None)
+        self.assertEqual(item['comment_count'], 0)
+        self.assertIn('pub_date', item)
+
+    def test_batch_in_one_query(self):
+        ids = [self.posts[3].pk, 10 ** 6, self.posts[0].pk]
+        with self.assertNumQueries(1):
+            data = self.client.get(
+                reverse('api:posts_batch'),
+                {'ids': ','.join(map(str, ids)), 'fields': 'id'}
+            ).json()
+        self.assertEqual(
+            data['results'], [{'id': ids[0]}, {'id': ids[2]}]
+        )
+        self.assertEqual(data['missing'], [10 ** 6])
+
+    @override_settings(API_BATCH_MAX=2)
+    def test_batch_errors(self):
+        url = reverse('api:posts_batch')
+        for ids in ('', 'a,b', '1,2,3', str(10 ** 20), f'1,-{10 ** 20}'):
+            with self.subTest(ids=ids):
+                response = self.client.get(url, {'ids': ids})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(
+            reverse('api:group_posts', args=['missing'])
+        ).status_code, 404)
+        self.assertEqual(self.client.get(
+            reverse('api:author_posts', args=['missing'])
+        ).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('api:follow_posts')).status_code, 401
+        )
+        self.assertEqual(
+            self.client.post(reverse('api:posts')).status_code, 405
+        )
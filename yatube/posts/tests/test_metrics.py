@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from sorl.thumbnail import default as thumbnail_default
+
+from ..metrics import exposition, registry
+from ..models import Post
+
+User = get_user_model()
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def scrape(self):
+        response = self.staff_client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_routes_recorded(self):
+        """Каждый ответ попадает в метрики под именем маршрута,
+        с запросами к базе, шаблонами и размером тела."""
+        for url in (reverse('posts'), reverse('posts'),
+                    reverse('profile', args=['author']),
+                    reverse('about:tech'), reverse('signup')):
+            self.client.get(url)
+        self.client.get('/nowhere/nothing/')
+        text = self.scrape()
+        for line in (
+            'yatube_requests_total{method="GET",route="posts",'
+            'status="200"} 2',
+            'yatube_request_duration_seconds_count{route="profile"} 1',
+            'yatube_request_duration_seconds_bucket{route="posts",'
+            'le="+Inf"} 2',
+            'yatube_requests_total{method="GET",route="about:tech",'
+            'status="200"} 1',
+            'yatube_requests_total{method="GET",route="signup",'
+            'status="200"} 1',
+            'yatube_requests_total{method="GET",route="unmatched",'
+            'status="404"} 1',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, text)
+        self.assertIn('# TYPE yatube_db_queries histogram', text)
+        self.assertNotIn('yatube_db_queries_sum{route="posts"} 0\n', text)
+        self.assertNotIn(
+            'yatube_template_duration_seconds_sum{route="posts"} 0\n', text
+        )
+        self.assertIn('yatube_response_size_bytes_count{route="posts"} 2',
+                      text)
+
+    def test_histogram_buckets_cumulative(self):
+        for value in (0.001, 0.02, 0.02, 20):
+            registry.observe('request_duration_seconds', {'route': 'x'},
+                             value)
+        text = exposition(registry.snapshot())
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{route="x",le="0.005"} 1',
+            text
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{route="x",le="0.025"} 3',
+            text
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{route="x",le="10"} 3',
+            text
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{route="x",le="+Inf"} 4',
+            text
+        )
+        self.assertIn('yatube_request_duration_seconds_count{route="x"} 4',
+                      text)
+
+    def test_thumbnail_lru(self):
+        """Счётчики LRU kvstore миниатюр попадают в выгрузку."""
+        lru = thumbnail_default.kvstore.lru
+        lru.clear()
+        self.addCleanup(lru.clear)
+        hits, misses = lru.hits, lru.misses
+        lru.set('key', 'value')
+        lru.get('key')
+        lru.get('missing')
+        text = self.scrape()
+        for line in (
+            '# TYPE yatube_thumbnail_lru_entries gauge',
+            f'yatube_thumbnail_lru_lookups_total{{result="hit"}} {hits + 1}',
+            'yatube_thumbnail_lru_lookups_total{result="miss"} '
+            f'{misses + 1}',
+            'yatube_thumbnail_lru_entries 1',
+            'yatube_thumbnail_lru_bytes 8',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, text)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        author_client = Client()
+        author_client.force_login(self.author)
+        self.assertEqual(author_client.get('/metrics').status_code, 403)
+
+    def test_shared_files_combined(self):
+        """С METRICS_DIR выгрузка складывает снимки всех процессов."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with open(os.path.join(directory, '1.json'), 'w') as other:
+            json.dump([[
+                'requests_total',
+                [['method', 'GET'], ['route', 'posts'], ['status', '200']],
+                5,
+            ]], other)
+        with self.settings(METRICS_DIR=directory):
+            self.client.get(reverse('posts'))
+            text = self.scrape()
+            self.assertTrue(
+                os.path.exists(os.path.join(directory, f'{os.getpid()}.json'))
+            )
+        self.assertIn(
+            'yatube_requests_total{method="GET",route="posts",status="200"} 6',
+            text
+        )
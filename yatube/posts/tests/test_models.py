@@ -1,7 +1,21 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 
-from ..models import Post, Group
+from ..management.commands import import_posts
+from ..models import (Comment, FeedEntry, Follow, Post, Group, Suggestion,
+                      UserStats)
+from ..search import search_posts
+from ..suggestions import FollowGraph
 
 User = get_user_model()
 
@@ -33,3 +47,226 @@ class ModelTest(TestCase):
         with self.subTest():
             for i in results:
                 self.assertEqual(results[i], i)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def assertStats(self, user, posts, followers, following):
+        stats = UserStats.objects.get(user=user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count, stats.following_count),
+            (posts, followers, following)
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении постов,
+        комментариев и подписок."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(author=self.author, user=self.reader)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertStats(self.author, 1, 1, 0)
+        self.assertStats(self.reader, 0, 0, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertStats(self.author, 1, 0, 0)
+        self.assertStats(self.reader, 0, 0, 0)
+        post.delete()
+        self.assertStats(self.author, 0, 0, 0)
+
+    def test_recount_stats(self):
+        """Команда recount_stats исправляет расхождения."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Post.objects.filter(pk=post.pk).update(comment_count=7)
+        UserStats.objects.filter(user=self.author).update(posts_count=9)
+        UserStats.objects.filter(user=self.reader).delete()
+
+        call_command('recount_stats', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertStats(self.author, 1, 0, 0)
+        self.assertStats(self.reader, 0, 0, 0)
+
+    def test_seed_fills_counters(self):
+        """Команда seed заполняет счётчики и ленты без расхождений."""
+        call_command('seed', users=20, posts=200, comments=100, follows=50,
+                     batch_size=7, seed=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Follow.objects.count(), 50)
+        out = StringIO()
+        call_command('recount_stats', stdout=out)
+        self.assertIn('пользователей 0, постов 0', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportPostsTest(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        with open(os.path.join(self.source, 'cat.gif'), 'wb') as image:
+            image.write(b'GIF89a')
+        self.reader = User.objects.create_user(username='reader')
+        records = [
+            {'type': 'group', 'slug': 'cats', 'title': 'Кошки'},
+            {'type': 'post', 'author': 'leo', 'group': 'cats',
+             'text': 'Первый пост', 'pub_date': '2015-03-01T10:00:00',
+             'image': 'cat.gif'},
+            {'type': 'post', 'author': 'leo', 'text': 'Второй пост',
+             'pub_date': '2016-03-01T10:00:00+00:00'},
+            {'type': 'follow', 'user': 'reader', 'author': 'leo'},
+            {'type': 'post', 'author': 'anna', 'text': 'Пост Анны'},
+            {'type': 'follow', 'user': 'leo', 'author': 'leo'},
+            {'type': 'unknown'},
+            {'type': 'post', 'author': 'leo', 'text': 'Дата числом',
+             'pub_date': 1425204000},
+            {'type': 'post', 'author': 'leo', 'text': 'Нет такой даты',
+             'pub_date': '2020-02-30T10:00:00'},
+            {'type': 'post', 'author': {'name': 'leo'}, 'text': 'Автор'},
+            {'type': 'post', 'author': 'leo', 'text': 'Картинки',
+             'image': ['cat.gif']},
+            {'type': 'follow', 'user': ['reader'], 'author': 'leo'},
+        ]
+        self.path = os.path.join(self.source, 'import.ndjson')
+        with open(self.path, 'w', encoding='utf-8') as source:
+            for record in records:
+                source.write(json.dumps(record, ensure_ascii=False) + '\n')
+            source.write('не json\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.source, ignore_errors=True)
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_import(self):
+        out = StringIO()
+        err = StringIO()
+        call_command('import_posts', self.path, batch_size=2,
+                     media_from=self.source, stdout=out, stderr=err)
+        self.assertIn('Готово. групп 1, постов 3, подписок 1', out.getvalue())
+        self.assertIn('пропущено строк: 7', out.getvalue())
+        for number in range(7, 14):
+            self.assertIn(f'Строка {number}: не запись импорта',
+                          err.getvalue())
+        leo = User.objects.get(username='leo')
+        first, second = leo.posts.order_by('pub_date')
+        self.assertEqual(first.group.slug, 'cats')
+        self.assertEqual(first.pub_date.year, 2015)
+        self.assertTrue(first.image.storage.exists(first.image.name))
+        self.assertEqual(second.pub_date.year, 2016)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=leo
+        ).exists())
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=self.reader
+            ).values_list('post', flat=True)),
+            {first.pk, second.pk}
+        )
+        self.assertEqual(list(search_posts('первый')), [first])
+        recount = StringIO()
+        call_command('recount_stats', stdout=recount)
+        self.assertIn('пользователей 0, постов 0', recount.getvalue())
+        self.assertEqual(leo.stats.posts_count, 2)
+
+    def test_rollback_removes_images(self):
+        """Изображения откаченной пачки удаляются из MEDIA_ROOT."""
+        class FailingImport(import_posts.Command):
+            def import_follows(self, records):
+                raise RuntimeError('сбой')
+
+        with self.assertRaises(RuntimeError):
+            call_command(FailingImport(), self.path, media_from=self.source,
+                         stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(default_storage.listdir('posts')[1], [])
+
+
+class SqliteMaintenanceTest(TransactionTestCase):
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout']
+            )
+            cursor.execute('PRAGMA synchronous')
+            # 1 - NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_maintenance(self):
+        """Первый запуск с --full включает инкрементальный VACUUM,
+        следующий возвращает страницы удалённых постов."""
+        call_command('sqlite_maintenance', full=True, stdout=StringIO())
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(text='пост ' * 500, author=author) for _ in range(50)
+        )
+        Post.objects.all().delete()
+        out = StringIO()
+        call_command('sqlite_maintenance', stdout=out)
+        self.assertIn('ANALYZE', out.getvalue())
+        self.assertRegex(
+            out.getvalue(), r'incremental_vacuum: свободных страниц \d+ -> 0'
+        )
+        self.assertNotIn('-> 0, освобождено 0 КБ', out.getvalue())
+
+
+class SuggestionsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            name: User.objects.create_user(username=name)
+            for name in ('reader', 'left', 'right', 'both', 'one', 'star')
+        }
+        follows = [
+            ('reader', 'left'), ('reader', 'right'),
+            ('left', 'both'), ('right', 'both'), ('right', 'one'),
+            ('left', 'star'), ('both', 'star'), ('one', 'star'),
+        ]
+        for user, author in follows:
+            Follow.objects.create(
+                user=cls.users[user], author=cls.users[author]
+            )
+
+    def pk(self, name):
+        return self.users[name].pk
+
+    def test_graph(self):
+        """Вес - число общих подписок, при равном весе выше популярный,
+        остаток - популярные авторы, кроме себя и уже прочитанных."""
+        graph = FollowGraph.load(chunk_size=2)
+        self.assertEqual(len(graph.authors), 8)
+        self.assertEqual(
+            graph.suggest(self.pk('reader'), 3),
+            [(self.pk('both'), 2), (self.pk('star'), 1), (self.pk('one'), 1)]
+        )
+        self.assertEqual(
+            graph.suggest(self.pk('star'), 2),
+            [(self.pk('both'), 0), (self.pk('left'), 0)]
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command('compute_suggestions', top=2, chunk_size=4, stdout=out)
+        self.assertIn('пользователей 6, рекомендаций 12', out.getvalue())
+        self.assertEqual(
+            list(self.users['reader'].suggestions.order_by(
+                'rank'
+            ).values_list('author__username', 'score')),
+            [('both', 2), ('star', 1)]
+        )
+        Follow.objects.create(
+            user=self.users['reader'], author=self.users['both']
+        )
+        self.assertFalse(Suggestion.objects.filter(
+            user=self.users['reader'], author=self.users['both']
+        ).exists())
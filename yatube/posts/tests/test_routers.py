@@ -0,0 +1,108 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from ..models import Follow, Post, UserStats
+from ..routers import COOKIE
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TransactionTestCase):
+    """Две базы SQLite: реплика не получает записей основной, по
+    содержимому страницы видно, откуда она прочитана."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        # Реплика отстаёт: пользователи уже есть, новых постов нет
+        User.objects.using('replica').bulk_create([
+            User(pk=user.pk, username=user.username, password=user.password)
+            for user in (self.author, self.reader)
+        ])
+        Post.objects.using('replica').bulk_create([
+            Post(text='Старый пост с реплики', author_id=self.author.pk)
+        ])
+        Post.objects.create(text='Пост в основной базе', author=self.author)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_reads_from_replica(self):
+        response = self.author_client.get(reverse('posts'))
+        self.assertContains(response, 'Старый пост с реплики')
+        self.assertNotContains(response, 'Пост в основной базе')
+
+    def test_anonymous_cache_filled_from_primary(self):
+        """Страница для кэша анонимов не берётся с отстающей реплики:
+        иначе после сброса кэша устаревшая страница осталась бы в нём
+        под новым поколением."""
+        self.assertContains(
+            self.client.get(reverse('posts')), 'Пост в основной базе'
+        )
+        Post.objects.create(text='Свежий пост', author=self.author)
+        for _ in range(2):
+            self.assertContains(
+                self.client.get(reverse('posts')), 'Свежий пост'
+            )
+
+    def test_writer_reads_own_writes(self):
+        """После записи автор видит свой пост, пока действует cookie,
+        остальные читают реплику."""
+        response = self.author_client.post(
+            reverse('new_post'), {'text': 'Только что написал'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(COOKIE, response.cookies)
+        self.assertTrue(Post.objects.filter(text='Только что написал'))
+        self.assertFalse(Post.objects.using('replica').filter(
+            text='Только что написал'
+        ))
+        self.assertContains(
+            self.author_client.get(reverse('posts')), 'Только что написал'
+        )
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        self.assertNotContains(
+            reader_client.get(reverse('posts')), 'Только что написал'
+        )
+
+        self.author_client.cookies[COOKIE] = str(time.time() - 1)
+        self.assertNotContains(
+            self.author_client.get(reverse('posts')), 'Только что написал'
+        )
+
+    def test_feed_seen_not_sticky(self):
+        """Отметка прочитанной ленты пишется при GET и не закрепляет
+        читателя за основной базой."""
+        Follow.objects.create(author=self.author, user=self.reader)
+        Follow.objects.using('replica').bulk_create([
+            Follow(author_id=self.author.pk, user_id=self.reader.pk,
+                   fanout=False)
+        ])
+        seen = Post.objects.using('replica').get().pub_date
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        response = reader_client.get(reverse('follow_index'))
+        self.assertContains(response, 'Старый пост с реплики')
+        self.assertNotIn(COOKIE, response.cookies)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).feed_seen, seen
+        )
+
+    def test_reads_without_cookie_keep_no_cookie(self):
+        response = self.author_client.get(reverse('posts'))
+        self.assertNotIn(COOKIE, response.cookies)
+
+    def test_outside_requests_primary(self):
+        """Команды и фоновые потоки читают основную базу."""
+        self.assertEqual(Post.objects.all().db, 'default')
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)),
+            ['Пост в основной базе']
+        )
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.shortcuts import render
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from yatube.urls import urlpatterns as project_urlpatterns
+from ..models import Post
+
+User = get_user_model()
+
+
+def posts_without_authors(request):
+    """Лента без select_related: автор каждой карточки - отдельный
+    запрос из шаблона."""
+    page = Paginator(Post.objects.order_by('pk'), 10).get_page(1)
+    return render(request, 'posts/index.html', {'page': page})
+
+
+urlpatterns = [
+    path('n-plus-one/', posts_without_authors, name='n_plus_one'),
+    *project_urlpatterns,
+]
+
+
+@override_settings(SLOW_QUERY_LOG=True, SLOW_QUERY_REPEATS=3,
+                   SLOW_QUERY_MS=10 ** 6, ROOT_URLCONF=__name__)
+class SlowQueryLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(4):
+            Post.objects.create(
+                text=f'Пост {i}',
+                author=User.objects.create_user(username=f'author{i}')
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def entries(self, url):
+        with self.assertLogs('posts.slow_queries', 'WARNING') as logs:
+            self.client.get(url)
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_repeated_queries_attributed_to_template(self):
+        """N+1 в шаблоне записывается одной записью с числом повторов,
+        view, шаблоном и строкой."""
+        entries = self.entries('/n-plus-one/')
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertEqual(entry['kind'], 'repeated')
+        self.assertEqual(entry['count'], 4)
+        self.assertEqual(entry['template'], 'includes/post_generic.html')
+        self.assertEqual(entry['line'], 6)
+        self.assertEqual(
+            entry['view'], 'posts.tests.test_slow_queries.'
+                           'posts_without_authors'
+        )
+        self.assertEqual(entry['route'], 'n_plus_one')
+        self.assertIn('auth_user', entry['sql'])
+
+    def test_slow_queries_attributed_to_code(self):
+        with self.settings(SLOW_QUERY_MS=0, SLOW_QUERY_REPEATS=10 ** 6):
+            entries = self.entries('/author0/')
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['kind'] == 'slow' for entry in entries))
+        self.assertIn('posts/views.py', {
+            entry['code'].split(':')[0] for entry in entries if entry['code']
+        })
+
+    def test_feed_with_select_related_is_quiet(self):
+        with self.assertRaises(AssertionError):
+            self.entries('/')
+
+
+class AnalyzeSlowQueriesTest(TestCase):
+    def test_summary(self):
+        entries = [
+            {'kind': 'repeated', 'view': 'v.feed', 'template': 'card.html',
+             'line': 9, 'code': None, 'sql': 'SELECT a', 'ms': 30,
+             'count': 10},
+            {'kind': 'repeated', 'view': 'v.feed', 'template': 'card.html',
+             'line': 9, 'code': None, 'sql': 'SELECT a', 'ms': 50,
+             'count': 10},
+            {'kind': 'slow', 'view': 'v.post', 'template': None,
+             'line': None, 'code': 'posts/views.py:40', 'sql': 'SELECT b',
+             'ms': 200, 'count': 1},
+        ]
+        log = tempfile.NamedTemporaryFile('w', suffix='.log', delete=False)
+        self.addCleanup(os.remove, log.name)
+        with log:
+            for entry in entries:
+                log.write(json.dumps(entry) + '\n')
+            log.write('не JSON\n')
+        out = StringIO()
+        call_command('analyze_slow_queries', log.name, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('posts/views.py:40', lines[0])
+        self.assertIn('200.0', lines[0])
+        self.assertIn('card.html:9', lines[2])
+        self.assertIn('80.0', lines[2])
+        self.assertIn('20 запр.', lines[2])
+        self.assertIn('Мест: 2, записей: 3', lines[-1])
@@ -0,0 +1,128 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from ..models import FeedEntry, Follow, Post, Task
+from ..tasks import claim, enqueue, execute, run_pending, task
+
+User = get_user_model()
+calls = []
+
+
+@task
+def remember(value):
+    calls.append(value)
+
+
+@task
+def broken():
+    raise RuntimeError('сломалось')
+
+
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        queued = enqueue(remember, value=1)
+        self.assertEqual(queued.state, Task.QUEUED)
+        self.assertEqual(calls, [])
+        run_pending()
+        self.assertEqual(calls, [1])
+        queued.refresh_from_db()
+        self.assertEqual(queued.state, Task.DONE)
+        self.assertEqual(queued.attempts, 1)
+
+    def test_unregistered(self):
+        with self.assertRaises(ValueError):
+            enqueue(print, value=1)
+
+    @override_settings(TASK_QUEUE=False)
+    def test_inline(self):
+        self.assertIsNone(enqueue(remember, value=2))
+        self.assertEqual(calls, [2])
+        self.assertFalse(Task.objects.exists())
+
+    def test_deduplication(self):
+        """Пока задача ждёт, вторая с тем же ключом не ставится; начатая
+        задача не мешает поставить новую."""
+        first = enqueue(remember, value=1, key='same')
+        self.assertIsNone(enqueue(remember, value=2, key='same'))
+        self.assertEqual(claim('worker').pk, first.pk)
+        self.assertIsNotNone(enqueue(remember, value=3, key='same'))
+
+    @override_settings(TASK_RETRY_DELAY=10, TASK_RETRY_DELAY_MAX=15)
+    def test_retry_with_backoff(self):
+        failing = enqueue(broken, max_attempts=3)
+        for attempt, delay in ((1, 10), (2, 15)):
+            started = timezone.now()
+            Task.objects.filter(pk=failing.pk).update(run_at=started)
+            run_pending()
+            failing.refresh_from_db()
+            self.assertEqual(failing.state, Task.QUEUED)
+            self.assertEqual(failing.attempts, attempt)
+            self.assertIn('RuntimeError: сломалось', failing.error)
+            self.assertGreaterEqual(
+                failing.run_at, started + timedelta(seconds=delay)
+            )
+            # До срока повтора задача не берётся
+            self.assertIsNone(claim('worker'))
+        Task.objects.filter(pk=failing.pk).update(run_at=timezone.now())
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            run_pending()
+        failing.refresh_from_db()
+        self.assertEqual(failing.state, Task.FAILED)
+        self.assertEqual(failing.attempts, 3)
+
+    def test_visibility_timeout(self):
+        """Задачу, за которую исполнитель не отчитался вовремя, берёт
+        другой; итог первого уже не записывается."""
+        enqueue(remember, value=1)
+        lost = claim('first')
+        self.assertIsNone(claim('second'))
+        Task.objects.filter(pk=lost.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        taken = claim('second')
+        self.assertEqual((taken.pk, taken.attempts), (lost.pk, 2))
+        execute(lost)
+        taken.refresh_from_db()
+        self.assertEqual(taken.state, Task.RUNNING)
+        execute(taken)
+        taken.refresh_from_db()
+        self.assertEqual(taken.state, Task.DONE)
+        self.assertEqual(calls, [1, 1])
+
+    def test_abandoned_last_attempt(self):
+        """Задача, брошенная исполнителем на последней попытке, больше
+        не берётся и считается невыполненной."""
+        enqueue(remember, value=1, max_attempts=1)
+        lost = claim('first')
+        Task.objects.filter(pk=lost.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            self.assertIsNone(claim('second'))
+        lost.refresh_from_db()
+        self.assertEqual(lost.state, Task.FAILED)
+        self.assertEqual(lost.attempts, 1)
+        self.assertIsNotNone(lost.finished)
+        self.assertEqual(calls, [])
+
+
+class TaskWorkerCommandTest(TransactionTestCase):
+    def test_burst(self):
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(author=author, user=reader)
+        Post.objects.create(text='Пост', author=author)
+        self.assertFalse(FeedEntry.objects.exists())
+        out = StringIO()
+        call_command('task_worker', burst=True, workers=1, stdout=out)
+        self.assertIn('В очереди 0, не выполнено 0', out.getvalue())
+        self.assertTrue(FeedEntry.objects.filter(user=reader).exists())
+        self.assertFalse(Task.objects.exclude(state=Task.DONE).exists())
@@ -1,17 +1,47 @@
+import base64
+import csv
+import gzip
+import json
+import os
 import shutil
+import tempfile
+from io import StringIO
 
 from django.core.cache import cache
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.cache.utils import make_template_fragment_key
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.template import Context, Template
 from django.urls import reverse
 from django import forms
+from sorl.thumbnail import default as thumbnail_default
 
-from ..models import Group, Post, Follow
+from ..models import Comment, FeedEntry, Group, Post, Follow, Suggestion
+from ..kvstore import LRUCache
+from ..page_cache import page_cache_stats
+from ..paginators import NEXT, CursorPaginator, decode_cursor
+from ..query_plans import bad_steps
+from ..tasks import run_pending
+from ..thumbnails import _run, generate, thumbnail_ready
 from yatube import settings
 
 User = get_user_model()
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 class PostsViewTests(TestCase):
     @classmethod
@@ -140,25 +170,37 @@ class PostsViewTests(TestCase):
         self.assertNotEqual(a, 0)
         self.assertEqual(b, 0)
 
-    def test_cache_index(self):
-        """Тестирует кэширование записей на главной странице."""
-        response1 = self.guest_client.get(reverse('posts'))
-        response1 = self.guest_client.get(reverse('posts'))
-        new_post = Post.objects.create(
-            text='Новый пост',
-            author=self.user
+    def test_cache_post_cards(self):
+        """Карточки постов кэшируются по версии и обновляются сразу
+        после правки поста и нового комментария."""
+        def card_key():
+            post = Post.objects.get(pk=self.post.pk)
+            return make_template_fragment_key(
+                'post_card', [post.id, post.version]
+            )
+
+        self.guest_client.get(reverse('posts'))
+        key = card_key()
+        self.assertIsNotNone(cache.get(key))
+
+        self.authorised_client.post(
+            reverse('post_edit', args=[self.user.username, self.post.id]),
+            {'text': 'Новый текст', 'group': self.group.id}
         )
-        response2 = self.guest_client.get(reverse('posts'))
-        self.assertEqual(
-            response1.context.get('page')[0].text,
-            response2.context.get('page')[0].text
+        self.assertNotEqual(card_key(), key)
+        response = self.guest_client.get(
+            reverse('group', args=[self.group.slug])
         )
-        cache.clear()
-        response2 = self.guest_client.get(reverse('posts'))
-        self.assertEqual(
-            response1.context.get('page')[0].text,
-            new_post.text
+        self.assertContains(response, 'Новый текст')
+
+        key = card_key()
+        self.authorised_client.post(
+            reverse('add_comment', args=[self.user.username, self.post.id]),
+            {'text': 'Комментарий'}
         )
+        self.assertNotEqual(card_key(), key)
+        response = self.guest_client.get(reverse('posts'))
+        self.assertContains(response, 'Комментариев: 1')
 
     def test_auth_subscribe(self):
         """Тестирует возможность подписываться и отписываться от
@@ -243,3 +285,1132 @@ class PaginatorViewsTest(TestCase):
         записей на последней странице."""
         response = self.client.get(reverse('posts') + '?page=2')
         self.assertEqual(len(response.context.get('page')), 5)
+
+
+@override_settings(PAGE_NUMBERED_MAX=settings.PAGE_MAX)
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {i}', author=cls.user)
+            for i in range(settings.PAGE_MAX * 2 + 5)
+        ]
+        cls.posts.reverse()
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url):
+        """Проходит ленту по курсорам next, возвращает страницы."""
+        pages = []
+        response = self.client.get(url)
+        while True:
+            page = response.context['page']
+            pages.append(page)
+            if not page.paginator.next_cursor:
+                return pages
+            response = self.client.get(
+                url, {'cursor': page.paginator.next_cursor}
+            )
+
+    def test_large_feed_uses_cursor(self):
+        """Длинная лента листается по курсору, без пропусков и
+        повторов."""
+        for url in [
+            reverse('posts'),
+            reverse('profile', args=[self.user.username])
+        ]:
+            with self.subTest(url=url):
+                pages = self.walk(url)
+                self.assertIsInstance(pages[0].paginator, CursorPaginator)
+                self.assertEqual(
+                    [post for page in pages for post in page],
+                    self.posts
+                )
+                self.assertEqual([len(page) for page in pages], [10, 10, 5])
+                self.assertFalse(pages[0].has_previous())
+                self.assertTrue(pages[-1].has_previous())
+
+    def test_previous_cursor(self):
+        """Курсор previous возвращает на предыдущую страницу."""
+        pages = self.walk(reverse('posts'))
+        response = self.client.get(
+            reverse('posts'),
+            {'cursor': pages[2].paginator.previous_cursor}
+        )
+        self.assertEqual(
+            list(response.context['page']), list(pages[1])
+        )
+
+    def test_bad_cursor(self):
+        """Повреждённый курсор отдаёт первую страницу."""
+        self.assertIsNone(decode_cursor('мусор'))
+        response = self.client.get(reverse('posts'), {'cursor': 'мусор'})
+        self.assertEqual(
+            list(response.context['page']),
+            self.posts[:settings.PAGE_MAX]
+        )
+        # Ключ вне диапазона целых SQLite тоже считается повреждением
+        date = self.posts[0].pub_date.isoformat()
+        for pk in (10 ** 20, -10 ** 20, 1e300):
+            raw = json.dumps([NEXT, date, pk]).encode()
+            cursor = base64.urlsafe_b64encode(raw).decode()
+            self.assertIsNone(decode_cursor(cursor))
+            response = self.client.get(reverse('posts'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(
+                reverse('api:posts'), {'cursor': cursor}
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_cursor_page_without_count(self):
+        """Страница по курсору строится одним запросом, без COUNT."""
+        paginator = CursorPaginator(Post.objects.all(), settings.PAGE_MAX)
+        with self.assertNumQueries(1):
+            page = paginator.get_page(None)
+            self.assertTrue(page.has_next())
+
+
+class FeedViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(text='Старый', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed(self):
+        response = self.reader_client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_fan_out_on_write(self):
+        """Подписка заполняет ленту, новый пост раскладывается в неё,
+        отписка её очищает. Заполнение и раскладка идут через очередь
+        задач, ответ их не ждёт: до заполнения посты автора подмешиваются
+        при чтении."""
+        self.reader_client.get(
+            reverse('profile_follow', args=[self.author.username])
+        )
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed(), ['Старый'])
+        run_pending()
+        self.assertTrue(Follow.objects.get(user=self.reader).fanout)
+        self.assertEqual(self.feed(), ['Старый'])
+        Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(self.feed(), ['Старый'])
+        run_pending()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(), 2
+        )
+        self.assertEqual(self.feed(), ['Новый', 'Старый'])
+        self.reader_client.get(
+            reverse('profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(FEED_FANOUT_MAX=0)
+    def test_celebrity_merged_on_read(self):
+        """Посты популярных авторов не раскладываются по лентам,
+        а подмешиваются при чтении."""
+        Follow.objects.create(author=self.author, user=self.reader)
+        Post.objects.create(text='Новый', author=self.author)
+        run_pending()
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed(), ['Новый', 'Старый'])
+
+    @override_settings(PAGE_MAX=3)
+    def test_merged_pages(self):
+        """Страницы по курсору вперёд и назад сливают записи ленты
+        и подмешиваемых авторов в общем порядке."""
+        celebrity = User.objects.create_user(username='celebrity')
+        Follow.objects.create(author=self.author, user=self.reader)
+        Follow.objects.create(author=celebrity, user=self.reader,
+                              fanout=False)
+        for i in range(8):
+            Post.objects.create(text=f'Пост {i}',
+                                author=(self.author, celebrity)[i % 3 == 0])
+        run_pending()
+        expected = [post.text for post in Post.objects.order_by(
+            '-pub_date', '-pk'
+        )]
+        pages, params = [], {}
+        while True:
+            response = self.reader_client.get(reverse('follow_index'),
+                                              params)
+            pages.append([post.text for post in response.context['page']])
+            cursor = response.context['page'].paginator.next_cursor
+            if not cursor:
+                break
+            params = {'cursor': cursor}
+        self.assertEqual(sum(pages, []), expected)
+        response = self.reader_client.get(reverse('follow_index'), {
+            'cursor': response.context['page'].paginator.previous_cursor
+        })
+        self.assertEqual(
+            [post.text for post in response.context['page']], pages[-2]
+        )
+
+
+class QueryCountViewsTest(TestCase):
+    """Число запросов страницы ленты не зависит от числа постов."""
+    # В группе и профиле на один запрос больше: версия ленты и дата
+    # последнего поста для ETag;
+    # на главной - счётчик новых постов в меню, в ленте - отметка
+    # прочитанного; в профиле и ленте - рекомендации «кого почитать»
+    queries = {'index': 5, 'group': 6, 'profile': 9, 'follow': 6}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Группа', description='Описание', slug='group'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(author=cls.author, user=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def add_posts(self, amount):
+        for i in range(amount):
+            post = Post.objects.create(
+                text=f'Пост {i}', author=self.author, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.reader, text='Да')
+        run_pending()
+
+    def assertQueries(self, queries):
+        urls = {
+            reverse('posts'): queries['index'],
+            reverse('group', args=[self.group.slug]): queries['group'],
+            reverse('profile', args=[self.author.username]):
+            queries['profile'],
+            reverse('follow_index'): queries['follow'],
+        }
+        for url, expected in urls.items():
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertNumQueries(expected):
+                    response = self.reader_client.get(url)
+                self.assertTrue(len(response.context['page']))
+
+    def test_numbered_pages(self):
+        self.add_posts(1)
+        self.assertQueries(self.queries)
+        self.add_posts(settings.PAGE_MAX)
+        self.assertQueries(self.queries)
+
+    @override_settings(PAGE_NUMBERED_MAX=0)
+    def test_cursor_pages(self):
+        self.add_posts(1)
+        self.assertQueries(self.queries)
+        self.add_posts(settings.PAGE_MAX)
+        self.assertQueries(self.queries)
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Группа', description='Описание', slug='group'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            reverse('posts'),
+            reverse('group', args=[self.group.slug]),
+            reverse('profile', args=[self.author.username]),
+            reverse('post', args=[self.author.username, self.post.id]),
+        ]
+
+    def test_anonymous_pages_cached(self):
+        """Повторный запрос анонима отдаётся из кэша без выборки постов
+        и отрисовки шаблонов, остаются только запросы для ETag,
+        авторизованные пользователи кэш обходят."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                # Кроме главной - один запрос по индексам для ETag
+                self.assertEqual(len(queries), int(url != self.urls[0]))
+                self.assertIsNone(response.context)
+                self.assertContains(response, 'Пост')
+        self.assertEqual(page_cache_stats()['hits'], len(self.urls))
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        response = reader_client.get(self.urls[0])
+        self.assertIsNotNone(response.context)
+
+    def test_writes_invalidate_pages(self):
+        """Новый пост, комментарий и подписка сразу сбрасывают
+        кэш затронутых страниц."""
+        for url in self.urls:
+            self.client.get(url)
+        Post.objects.create(
+            text='Свежий пост', author=self.author, group=self.group
+        )
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
+
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        self.assertContains(self.client.get(self.urls[3]), 'Комментарий')
+
+        Follow.objects.create(author=self.author, user=self.reader)
+        self.assertContains(self.client.get(self.urls[2]), 'Подписчиков: 1')
+        self.assertGreater(page_cache_stats()['invalidations'], 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.user,
+            image=SimpleUploadedFile('thumb.gif', SMALL_GIF, 'image/gif')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        thumbnail_default.kvstore.lru.clear()
+
+    def ready(self):
+        geometry, options = settings.POST_THUMBNAILS[0]
+        return thumbnail_default.backend.get_ready_thumbnail(
+            self.post.image, geometry, **options
+        )
+
+    def test_placeholder_until_ready(self):
+        """Пока миниатюры нет, вместо неё отдаётся заглушка, запрос её
+        не создаёт."""
+        response = self.client.get(reverse('posts'))
+        self.assertContains(response, settings.THUMBNAIL_DUMMY_SOURCE)
+        self.assertIsNone(self.ready())
+
+        generate(self.post)
+        cache.clear()
+        response = self.client.get(reverse('posts'))
+        self.assertNotContains(response, settings.THUMBNAIL_DUMMY_SOURCE)
+        self.assertContains(response, self.ready().url)
+
+    def test_ready_thumbnail_bumps_card(self):
+        """Готовая миниатюра сбрасывает карточку поста."""
+        version = self.post.version
+        thumbnail_ready(self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, version + 1)
+
+    def test_generate_bumps_card(self):
+        """Созданные сразу миниатюры сбрасывают карточку поста, повторный
+        вызов без новых миниатюр её не трогает."""
+        post = Post.objects.get(pk=self.post.pk)
+        version = post.version
+        generate(post)
+        post.refresh_from_db()
+        self.assertEqual(post.version, version + 1)
+        generate(post)
+        post.refresh_from_db()
+        self.assertEqual(post.version, version + 1)
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(max_entries=2, max_bytes=1000, ttl=60)
+        lru.set('a', '1')
+        lru.set('b', '2')
+        lru.get('a')
+        lru.set('c', '3')
+        self.assertEqual(lru.get('a'), '1')
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.stats()['evictions'], 1)
+
+    def test_evicts_by_size(self):
+        lru = LRUCache(max_entries=100, max_bytes=9, ttl=60)
+        lru.set('a', '1234')
+        lru.set('b', '1234')
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.get('b'), '1234')
+        self.assertEqual(lru.stats()['bytes'], 5)
+        lru.set('c', 'x' * 20)
+        self.assertIsNone(lru.get('c'))
+
+    def test_expires_after_ttl(self):
+        lru = LRUCache(max_entries=100, max_bytes=1000, ttl=-1)
+        lru.set('a', '1')
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.stats()['entries'], 0)
+
+    def test_stats(self):
+        lru = LRUCache(max_entries=100, max_bytes=1000, ttl=60)
+        lru.set('a', '1')
+        lru.get('a')
+        lru.get('b')
+        stats = lru.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ThumbnailKVStoreTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test')
+        for i in range(3):
+            post = Post.objects.create(
+                text=f'Пост {i}',
+                author=cls.user,
+                image=SimpleUploadedFile(
+                    f'lru{i}.gif', SMALL_GIF, 'image/gif'
+                )
+            )
+            generate(post)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.kvstore = thumbnail_default.kvstore
+        self.kvstore.lru.clear()
+        self.client.force_login(self.user)
+
+    def ready(self, post):
+        geometry, options = settings.POST_THUMBNAILS[0]
+        return thumbnail_default.backend.get_ready_thumbnail(
+            post.image, geometry, **options
+        )
+
+    def test_page_thumbnails_loaded_in_one_query(self):
+        """Записи миниатюр страницы читаются из базы одним запросом,
+        повторная страница обходится без базы и кэша."""
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            self.kvstore.prefetch([
+                thumbnail_default.backend.thumbnail_file(
+                    post.image.name, geometry, **options
+                )
+                for post in posts
+                for geometry, options in settings.POST_THUMBNAILS
+            ])
+        self.assertEqual(self.kvstore.lru.stats()['entries'], 3)
+        cache.clear()
+        hits = self.kvstore.lru.stats()['hits']
+        with self.assertNumQueries(0):
+            for post in posts:
+                self.assertIsNotNone(self.ready(post))
+        self.assertEqual(self.kvstore.lru.stats()['hits'], hits + 3)
+
+    def test_listing_prefetches_thumbnails(self):
+        """Главная страница загружает записи миниатюр заранее."""
+        self.client.get(reverse('posts'))
+        self.assertEqual(self.kvstore.lru.stats()['entries'], 3)
+
+    def test_new_image_drops_old_thumbnails(self):
+        """Замена изображения поста удаляет миниатюры старого из kvstore
+        и LRU процесса."""
+        post = Post.objects.first()
+        old = self.ready(post)
+        self.assertIsNotNone(old)
+        post.image = SimpleUploadedFile('new.gif', SMALL_GIF, 'image/gif')
+        post.save()
+        self.assertIsNone(self.kvstore.get(old))
+        self.assertFalse(old.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GenerateThumbnailsCommandTest(TransactionTestCase):
+    """Пул потоков пишет в базу из своих соединений, поэтому данные
+    должны быть зафиксированы."""
+    def setUp(self):
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {i}',
+                author=User.objects.create_user(username=f'user{i}'),
+                image=SimpleUploadedFile(
+                    f'thumb{i}.gif', SMALL_GIF, 'image/gif'
+                )
+            )
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_generate_thumbnails_command(self):
+        """Команда generate_thumbnails создаёт миниатюры для
+        существующих постов."""
+        out = StringIO()
+        # Общая база в памяти не ждёт блокировку таблицы, а сразу
+        # отвечает "table is locked", поэтому поток в пуле один
+        call_command('generate_thumbnails', workers=1, chunk_size=2,
+                     stdout=out, stderr=out)
+        self.assertIn('для 3 постов, ошибок: 0', out.getvalue())
+        geometry, options = settings.POST_THUMBNAILS[0]
+        for post in self.posts:
+            self.assertIsNotNone(
+                thumbnail_default.backend.get_ready_thumbnail(
+                    post.image, geometry, **options
+                )
+            )
+            version = post.version
+            post.refresh_from_db()
+            self.assertEqual(post.version, version + 1)
+
+    def test_pool_bumps_card_for_ready_thumbnail(self):
+        """Заявка из пула на уже готовую миниатюру всё равно сбрасывает
+        страницы, закэшированные с заглушкой."""
+        post = self.posts[0]
+        generate(post)
+        post.refresh_from_db()
+        geometry, options = settings.POST_THUMBNAILS[0]
+        _run(None, post.image.name, geometry, options)
+        version = post.version
+        post.refresh_from_db()
+        self.assertEqual(post.version, version + 1)
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test')
+        cls.cat = Post.objects.create(
+            text='Котики, котики и ещё раз котики', author=cls.user
+        )
+        cls.mixed = Post.objects.create(
+            text='Про котиков немного, а в основном про собак и погоду',
+            author=cls.user
+        )
+        cls.dog = Post.objects.create(text='Собаки', author=cls.user)
+
+    def found(self, query, **params):
+        response = self.client.get(reverse('search'), {'q': query, **params})
+        return [post.pk for post in response.context['page']]
+
+    def test_ranked_results(self):
+        """Найдены посты со всеми словами, подходящие лучше - первыми,
+        слова ищутся по началу и без учёта регистра."""
+        self.assertEqual(self.found('КОТИК'), [self.cat.pk, self.mixed.pk])
+        self.assertEqual(self.found('котик собак'), [self.mixed.pk])
+        self.assertEqual(self.found(''), [])
+        self.assertEqual(self.found('"*)('), [])
+
+    def test_index_follows_edits(self):
+        dog = Post.objects.get(pk=self.dog.pk)
+        dog.text = 'Попугаи'
+        dog.save()
+        self.assertEqual(self.found('попуга'), [dog.pk])
+        self.assertEqual(self.found('собак'), [self.mixed.pk])
+        dog.delete()
+        self.assertEqual(self.found('попуга'), [])
+
+    @override_settings(PAGE_MAX=1)
+    def test_pages_keep_query(self):
+        response = self.client.get(reverse('search'), {'q': 'котик'})
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82%D0%B8%D0%BA')
+        self.assertEqual(self.found('котик', page=2), [self.mixed.pk])
+
+    def test_rebuild_command(self):
+        Post.objects.filter(pk=self.dog.pk).update(text='Хомяки')
+        out = StringIO()
+        call_command('rebuild_search_index', chunk_size=2, stdout=out)
+        self.assertIn('Проиндексировано постов: 3', out.getvalue())
+        self.assertEqual(self.found('хомяк'), [self.dog.pk])
+
+    def test_admin_search(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собак'}
+        )
+        self.assertEqual(
+            {post.pk for post in response.context['cl'].result_list},
+            {self.mixed.pk, self.dog.pk}
+        )
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='test')
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(text='Пост', author=user, group=group)
+        Comment.objects.create(post=post, author=user, text='Комментарий')
+        # В ленте подписок есть и разложенные записи, и автор, посты
+        # которого подмешиваются при чтении
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='Текст', author=author)
+        Follow.objects.create(author=author, user=user, fanout=False)
+        FeedEntry.objects.create(user=user, post=post, pub_date=post.pub_date)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_use_indexes(self):
+        """Запросы всех страниц posts обходятся без полного прохода
+        по таблицам и сортировки во временном B-дереве."""
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('Проверено запросов', out.getvalue())
+
+    def test_bad_steps(self):
+        self.assertEqual(
+            bad_steps('SELECT id FROM posts_post ORDER BY text', []),
+            ['USE TEMP B-TREE FOR ORDER BY']
+        )
+        self.assertEqual(bad_steps(
+            'SELECT id FROM posts_post WHERE author_id = %s '
+            'ORDER BY pub_date DESC', [1]
+        ), [])
+        self.assertEqual(
+            bad_steps('SELECT id FROM posts_post WHERE text = %s', ['a']),
+            ['SCAN posts_post']
+        )
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='test')
+        other = User.objects.create_user(username='other')
+        group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {i}', author=cls.user,
+                                group=group if i else None)
+            for i in range(3)
+        ]
+        Post.objects.create(text='Чужой пост', author=other)
+        cls.comment = Comment.objects.create(
+            post=cls.posts[0], author=cls.user, text='Мой, "с кавычками"'
+        )
+        Comment.objects.create(post=cls.posts[0], author=other, text='Чужой')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, export_format):
+        response = self.client.get(reverse('export'),
+                                   {'format': export_format})
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('ndjson').split(
+            '\n'
+        ) if line]
+        self.assertEqual(
+            [(row['type'], row['id']) for row in rows],
+            [('post', post.pk) for post in self.posts]
+            + [('comment', self.comment.pk)]
+        )
+        self.assertEqual(rows[1]['group'], 'group')
+        self.assertEqual(rows[-1]['post'], self.posts[0].pk)
+
+    def test_csv(self):
+        rows = list(csv.DictReader(StringIO(self.export('csv'))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['text'], 'Пост 0')
+        self.assertEqual(rows[-1]['text'], 'Мой, "с кавычками"')
+        self.assertEqual(rows[-1]['image'], '')
+
+    def test_errors(self):
+        response = self.client.get(reverse('export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        response = self.client.get(reverse('export'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_user_data', 'test', format='csv',
+                     chunk_size=1, stdout=out)
+        self.assertEqual(out.getvalue(), self.export('csv'))
+
+
+@override_settings(COMMENTS_PAGE_MAX=2)
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, text=f'Комментарий {i}',
+                author=User.objects.create_user(username=f'reader{i}')
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def url(self, name):
+        return reverse(name, args=[self.author.username, self.post.id])
+
+    def test_walk_comments_by_fragments(self):
+        """Комментарии идут от старых к новым, фрагменты по курсору
+        продолжают страницу поста."""
+        response = self.client.get(self.url('post'))
+        page = response.context['comments']
+        seen = list(page)
+        while page.paginator.next_cursor:
+            response = self.client.get(
+                self.url('comments'), {'cursor': page.paginator.next_cursor}
+            )
+            self.assertTemplateUsed(response, 'includes/comments.html')
+            self.assertTemplateNotUsed(response, 'posts/post.html')
+            page = response.context['comments']
+            seen += list(page)
+        self.assertEqual(seen, self.comments)
+
+    def test_post_page_links(self):
+        response = self.client.get(self.url('post'))
+        cursor = response.context['comments'].paginator.next_cursor
+        self.assertContains(response, f'{self.url("comments")}?cursor=')
+        response = self.client.get(self.url('post'), {'cursor': cursor})
+        self.assertEqual(
+            list(response.context['comments']), self.comments[2:4]
+        )
+        self.assertContains(response, 'К первым комментариям')
+
+    def test_queries_do_not_grow(self):
+        """Число запросов страницы поста не зависит от числа
+        комментариев: авторы выбираются вместе с ними."""
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url('post'))
+        for i in range(20):
+            Comment.objects.create(
+                post=self.post, text='Ещё', author=self.comments[i % 5].author
+            )
+        cache.clear()
+        with self.assertNumQueries(len(few)):
+            self.client.get(self.url('post'))
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(
+            title='Группа', description='Описание', slug='group'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            reverse('group', args=[self.group.slug]),
+            reverse('profile', args=[self.author.username]),
+            reverse('post', args=[self.author.username, self.post.id]),
+        ]
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified_without_rendering(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('no-cache', response['Cache-Control'])
+                with CaptureQueriesContext(connection) as queries:
+                    repeated = self.revalidate(self.client, url, response)
+                self.assertEqual(repeated.status_code, 304)
+                self.assertIsNone(repeated.context)
+                self.assertEqual(len(queries), 1)
+
+    def test_no_last_modified(self):
+        """Дата не отражает правки и удаления, поэтому страницы
+        отдаются без Last-Modified и If-Modified-Since не даёт 304."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertFalse(response.has_header('Last-Modified'))
+                repeated = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+                )
+                self.assertEqual(repeated.status_code, 200)
+
+    def test_edited_comment(self):
+        """Правка комментария меняет ETag страницы поста."""
+        comment = Comment.objects.create(
+            text='Комментарий', author=self.reader, post=self.post
+        )
+        url = self.urls[2]
+        response = self.client.get(url)
+        comment.text = 'Исправленный комментарий'
+        comment.save()
+        self.assertEqual(
+            self.revalidate(self.client, url, response).status_code, 200
+        )
+
+    def test_new_csrf_token_after_login(self):
+        """Вход меняет токен CSRF, и страница поста с формой комментария
+        отдаётся заново, а не 304 со старым токеном."""
+        credentials = {'username': 'visitor', 'password': 'password'}
+        User.objects.create_user(**credentials)
+        client = Client()
+        client.post(reverse('login'), credentials)
+        url = self.urls[2]
+        response = client.get(url)
+        token = client.cookies['csrftoken'].value
+        client.post(reverse('logout'))
+        client.post(reverse('login'), credentials)
+        self.assertNotEqual(client.cookies['csrftoken'].value, token)
+        self.assertEqual(
+            self.revalidate(client, url, response).status_code, 200
+        )
+
+    def test_moved_post_resets_old_group(self):
+        """Уход старого поста в другую группу не меняет дату последнего
+        поста, но меняет версию ленты прежней группы."""
+        Post.objects.create(text='Свежий', author=self.author,
+                            group=self.group)
+        url = self.urls[0]
+        response = self.client.get(url)
+        other = Group.objects.create(title='Другая', slug='other')
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = other
+        post.save()
+        self.assertEqual(
+            self.revalidate(self.client, url, response).status_code, 200
+        )
+
+    def test_changes_reset_validators(self):
+        """Правка поста, комментарий, новый и удалённый пост меняют
+        ETag всех страниц, где они видны."""
+        changes = [
+            lambda: Post.objects.filter(pk=self.post.pk).first().save(),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'
+            ),
+            lambda: Comment.objects.all().delete(),
+            lambda: Post.objects.create(
+                text='Новый', author=self.author, group=self.group
+            ),
+            lambda: Post.objects.filter(text='Новый').delete(),
+        ]
+        for change in changes:
+            responses = {url: self.client.get(url) for url in self.urls}
+            change()
+            for url, response in responses.items():
+                with self.subTest(url=url):
+                    self.assertEqual(
+                        self.revalidate(self.client, url, response)
+                        .status_code, 200
+                    )
+
+    def test_viewer_and_follow_state(self):
+        """ETag зависит от зрителя и от его подписки на автора."""
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        for url in self.urls[1:]:
+            with self.subTest(url=url):
+                anonymous = self.client.get(url)
+                response = reader_client.get(url)
+                self.assertNotEqual(response['ETag'], anonymous['ETag'])
+                Follow.objects.create(author=self.author, user=self.reader)
+                self.assertEqual(
+                    self.revalidate(reader_client, url, response)
+                    .status_code, 200
+                )
+                Follow.objects.all().delete()
+
+    def test_missing_page(self):
+        response = self.client.get(
+            reverse('profile', args=['nobody']), HTTP_IF_NONE_MATCH='*'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+STATIC_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(STATIC_ROOT=STATIC_ROOT)
+class StaticAssetsTest(TestCase):
+    css = 'admin/css/base.css'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(STATIC_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        response.body = b''.join(response.streaming_content)
+        return response
+
+    def test_template_uses_hashed_names(self):
+        """Тег static ведёт на имя с хэшем, файл без записи
+        в манифесте - на своё имя."""
+        rendered = Template(
+            "{% load static %}{% static 'admin/css/base.css' %} "
+            "{% static 'bootstrap/dist/css/bootstrap.min.css' %}"
+        ).render(Context())
+        hashed, plain = rendered.split()
+        self.assertRegex(hashed, r'^/static/admin/css/base\.\w{12}\.css$')
+        self.assertEqual(plain, '/static/bootstrap/dist/css/bootstrap.min.css')
+
+    def test_precompressed_variant(self):
+        url = staticfiles_storage.url(self.css)
+        plain = self.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(plain['Content-Type'], 'text/css')
+        self.assertIn('immutable', plain['Cache-Control'])
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        packed = self.get(url, HTTP_ACCEPT_ENCODING='deflate, gzip')
+        self.assertEqual(packed['Content-Encoding'], 'gzip')
+        self.assertEqual(packed['Content-Type'], 'text/css')
+        self.assertLess(len(packed.body), len(plain.body))
+        self.assertEqual(gzip.decompress(packed.body), plain.body)
+
+        refused = self.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+    def test_unhashed_name_revalidates(self):
+        response = self.get(f'/static/{self.css}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_missing_files(self):
+        for url in ('/static/nothing.css', '/static/%2e%2e/manage.py'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MediaServingTest(TestCase):
+    url = '/media/posts/image.bin'
+    content = bytes(range(256)) * 4
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(MEDIA_ROOT, 'posts'))
+        with open(os.path.join(MEDIA_ROOT, 'posts', 'image.bin'), 'wb') as f:
+            f.write(cls.content)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        response.body = b''.join(response.streaming_content) if (
+            response.streaming
+        ) else response.content
+        return response
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_ranges(self):
+        size = len(self.content)
+        cases = {
+            'bytes=10-19': (10, 19),
+            'bytes=1000-': (1000, size - 1),
+            'bytes=-5': (size - 5, size - 1),
+            'bytes=1020-5000': (1020, size - 1),
+        }
+        for header, (first, last) in cases.items():
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response.body, self.content[first:last + 1])
+                self.assertEqual(
+                    response['Content-Range'], f'bytes {first}-{last}/{size}'
+                )
+                self.assertEqual(
+                    int(response['Content-Length']), last - first + 1
+                )
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        response = self.get(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(
+            response['Content-Range'], f'bytes */{len(self.content)}'
+        )
+        for header in ('bytes=0-1,5-6', 'bytes=9-3', 'items=0-1'):
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.body, self.content)
+
+    def test_validators(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        stale = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+        fresh = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(fresh.status_code, 206)
+
+    def test_offload_headers(self):
+        with self.settings(MEDIA_OFFLOAD='x-accel-redirect'):
+            response = self.get()
+            self.assertEqual(response['X-Accel-Redirect'],
+                             '/protected-media/posts/image.bin')
+            self.assertEqual(response.body, b'')
+        with self.settings(MEDIA_OFFLOAD='x-sendfile'):
+            self.assertEqual(
+                self.get()['X-Sendfile'],
+                os.path.join(MEDIA_ROOT, 'posts', 'image.bin')
+            )
+
+    def test_outside_media_root(self):
+        response = self.client.get('/media/%2e%2e/yatube/settings.py')
+        self.assertEqual(response.status_code, 404)
+
+
+class UnreadPostsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(author=cls.author, user=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def unread(self, **headers):
+        return self.reader_client.get(reverse('follow_unread'), **headers)
+
+    def test_counts_posts_since_last_visit(self):
+        self.assertEqual(self.unread().json(), {'unread': 0, 'more': False})
+        for i in range(2):
+            Post.objects.create(text=f'Новый {i}', author=self.author)
+        self.assertEqual(self.unread().json()['unread'], 2)
+        response = self.reader_client.get(reverse('posts'))
+        self.assertContains(
+            response, '<span class="badge badge-primary" id="unread-posts" '
+            f'data-url="{reverse("follow_unread")}">2</span>', html=True
+        )
+        self.reader_client.get(reverse('follow_index'))
+        self.assertEqual(self.unread().json()['unread'], 0)
+        Post.objects.create(text='Ещё новее', author=self.author)
+        self.assertEqual(self.unread().json()['unread'], 1)
+
+    def test_conditional_pages_without_badge(self):
+        """Счётчика нет в ETag группы, профиля и поста, поэтому на этих
+        страницах его нет и в меню."""
+        post = Post.objects.create(text='Новый', author=self.author)
+        group = Group.objects.create(title='Группа', slug='group')
+        for url in (reverse('group', args=[group.slug]),
+                    reverse('profile', args=[self.author.username]),
+                    reverse('post', args=[self.author.username, post.pk])):
+            with self.subTest(url=url):
+                self.assertNotContains(
+                    self.reader_client.get(url), 'id="unread-posts"'
+                )
+
+    @override_settings(FEED_UNREAD_MAX=2)
+    def test_capped(self):
+        for i in range(4):
+            Post.objects.create(text=f'Новый {i}', author=self.author)
+        self.assertEqual(self.unread().json(), {'unread': 2, 'more': True})
+        response = self.reader_client.get(reverse('posts'))
+        self.assertContains(response, '>2+</span>')
+
+    def test_not_modified(self):
+        """Пока число новых постов не изменилось, опрос с ETag получает
+        304 одним запросом к базе, кроме сессии и пользователя."""
+        etag = self.unread()['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.unread(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 3)
+        Post.objects.create(text='Новый', author=self.author)
+        response = self.unread(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SuggestionsViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.star = User.objects.create_user(username='star')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_shown_on_follow_and_profile(self):
+        Suggestion.objects.create(
+            user=self.reader, author=self.star, score=3, rank=0
+        )
+        follow_url = reverse('profile_follow', args=['star'])
+        for url in (reverse('follow_index'),
+                    reverse('profile', args=['author'])):
+            with self.subTest(url=url):
+                response = self.reader_client.get(url)
+                self.assertContains(response, 'Кого почитать')
+                self.assertContains(response, 'читают 3 из ваших подписок')
+                self.assertContains(response, follow_url)
+        self.assertNotContains(
+            self.reader_client.get(reverse('profile', args=['star'])),
+            'Кого почитать'
+        )
+
+    def test_profile_etag_follows_suggestions(self):
+        """Пересчёт рекомендаций меняет ETag профиля."""
+        url = reverse('profile', args=['author'])
+        etag = self.reader_client.get(url)['ETag']
+        Suggestion.objects.create(user=self.reader, author=self.star, rank=0)
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
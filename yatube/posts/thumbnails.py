@@ -0,0 +1,167 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile, ImageFile
+
+from .counters import bump_versions
+from .models import Post
+from .page_cache import invalidate, post_scopes
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    """Не создаёт миниатюры в потоке запроса: отдаёт готовую из
+    kvstore, а если её нет - заглушку, и ставит создание в пул."""
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры с теми же параметрами, что у sorl, без
+        обращения к kvstore и хранилищу."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из kvstore или None."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not settings.THUMBNAIL_WORKERS:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        thumbnail = self.get_ready_thumbnail(
+            file_, geometry_string, **options
+        )
+        if thumbnail:
+            return thumbnail
+        schedule(ImageFile(file_).name, geometry_string, options)
+        return DummyImageFile(geometry_string)
+
+    def create_thumbnail(self, name, geometry_string, **options):
+        """Создаёт миниатюру, если её ещё нет."""
+        return super().get_thumbnail(
+            ImageFile(name, default.storage), geometry_string, **options
+        )
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def _run(key, name, geometry_string, options):
+    backend = default.backend
+    try:
+        # Миниатюру могла создать команда или другой процесс, а страницы
+        # с заглушкой, по которым её заказали, всё ещё в кэше
+        if not backend.get_ready_thumbnail(name, geometry_string, **options):
+            backend.create_thumbnail(name, geometry_string, **options)
+        thumbnail_ready(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', name)
+    finally:
+        with _lock:
+            _pending.discard(key)
+        close_old_connections()
+
+
+def thumbnail_ready(name):
+    """Карточки и страницы с заглушкой вместо готовой миниатюры
+    устаревают."""
+    posts = Post.objects.filter(image=name)
+    bump_versions(posts)
+    for post in posts.select_related('author', 'group'):
+        invalidate(*post_scopes(post))
+
+
+def _submit(name, geometry_string, options):
+    key = (name, geometry_string, repr(sorted(options.items())))
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    _get_executor().submit(_run, key, name, geometry_string, options)
+
+
+def schedule(name, geometry_string, options):
+    """Ставит создание миниатюры в пул после фиксации транзакции.
+    Повторные заявки на ту же миниатюру, пока она в очереди,
+    отбрасываются."""
+    options = dict(options)
+    transaction.on_commit(
+        lambda: _submit(name, geometry_string, options)
+    )
+
+
+def generate(post):
+    """Сразу создаёт все миниатюры поста из POST_THUMBNAILS и сбрасывает
+    страницы, если какой-то из них не было."""
+    backend = default.backend
+    created = False
+    for geometry_string, options in settings.POST_THUMBNAILS:
+        if backend.get_ready_thumbnail(
+            post.image.name, geometry_string, **options
+        ):
+            continue
+        backend.create_thumbnail(post.image.name, geometry_string, **options)
+        created = True
+    if created:
+        thumbnail_ready(post.image.name)
+
+
+def prefetch_thumbnails(posts):
+    """Одним заходом загружает из kvstore записи миниатюр POST_THUMBNAILS
+    для постов страницы, чтобы шаблон не ходил за каждой отдельно."""
+    prefetch = getattr(default.kvstore, 'prefetch', None)
+    if prefetch is None:
+        return
+    backend = default.backend
+    prefetch([
+        backend.thumbnail_file(post.image.name, geometry_string, **options)
+        for post in posts if post.image
+        for geometry_string, options in settings.POST_THUMBNAILS
+    ])
+
+
+def forget_thumbnails(name):
+    """Удаляет миниатюры заменённого изображения вместе с их записями
+    в kvstore и в LRU процесса."""
+    default.kvstore.delete(ImageFile(name, default.storage))
+
+
+def pregenerate(post):
+    """Ставит в пул создание всех миниатюр поста из POST_THUMBNAILS,
+    без пула создаёт их сразу."""
+    if not post.image:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        generate(post)
+        return
+    for geometry_string, options in settings.POST_THUMBNAILS:
+        schedule(post.image.name, geometry_string, options)
@@ -23,6 +23,21 @@ urlpatterns = [
         views.follow_index,
         name='follow_index'
     ),
+    path(
+        'follow/unread/',
+        views.follow_unread,
+        name='follow_unread'
+    ),
+    path(
+        'search/',
+        views.search,
+        name='search'
+    ),
+    path(
+        'export/',
+        views.export,
+        name='export'
+    ),
     path(
         '<str:username>/',
         views.profile,
@@ -33,6 +48,11 @@ urlpatterns = [
         views.post_view,
         name='post'
     ),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.comments,
+        name='comments'
+    ),
     path(
         '<str:username>/<int:id_post>/edit/',
         views.post_edit,
@@ -2,44 +2,70 @@ from http import HTTPStatus
 
 
 from django.shortcuts import render, get_object_or_404
-from django.core.paginator import Paginator
 from django.contrib.auth import get_user_model
 from django.urls import reverse_lazy, reverse
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
+from django.http import (HttpResponseBadRequest, HttpResponseRedirect,
+                         JsonResponse, StreamingHttpResponse)
 from django.views.generic import CreateView
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.conf import settings
+from django.core.paginator import Paginator
 
+from .conditional import (conditional_page, group_state, is_followed,
+                          post_state, profile_state, suggested,
+                          unread_posts, unread_state)
+from .counters import stats_for
+from .export import FORMATS, export_lines
+from .feed import FeedPaginator, mark_seen
 from .forms import PostForm, CommentForm
 from .models import Post, Group, Follow
-from yatube import settings
+from .page_cache import cache_anonymous
+from .paginators import CursorPaginator, paginate
+from .search import search_posts
+from .thumbnails import prefetch_thumbnails, pregenerate
 
 User = get_user_model()
 
 
+@conditional_page(profile_state)
+@cache_anonymous('author:{username}')
 def profile(request, username):
     """Выводит последние посты автора по PAGE_MAX на страницу."""
     author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    posts_amount = posts.count()
-    paginator = Paginator(posts, settings.PAGE_MAX)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    if request.user.is_authenticated:
-        is_followed = Follow.objects.filter(
-            author__username=username,
-            user=request.user
-        ).exists()
-    else:
-        is_followed = False
+    posts = author.posts.select_related('group')
+    posts_amount = stats_for(author).posts_count
+    page = paginate(request, posts)
+    prefetch_thumbnails(page)
+    # Самого автора на его странице не предлагаем
+    suggestions = [
+        suggestion for suggestion in suggested(request)
+        if suggestion.author_id != author.pk
+    ]
     return render(
         request, 'posts/profile.html', {'page': page,
                                         'posts_amount': posts_amount,
                                         'author': author,
-                                        'is_followed': is_followed}
+                                        'is_followed': is_followed(
+                                            request, author.pk
+                                        ),
+                                        'suggestions': suggestions}
     )
 
 
+def comments_page(request, post):
+    """Страница комментариев поста по курсору, от старых к новым,
+    с авторами в том же запросе."""
+    return CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PAGE_MAX,
+        date_field='created',
+        descending=False
+    ).get_page(request.GET.get('cursor'))
+
+
+@conditional_page(post_state)
+@cache_anonymous('author:{username}')
 def post_view(request, username, post_id):
     """Выводит один конкретный пост, позволяет его комментировать."""
     post = get_object_or_404(
@@ -48,21 +74,14 @@ def post_view(request, username, post_id):
         author__username=username
     )
     author = post.author
-    posts_amount = author.posts.count()
-    if request.user.is_authenticated:
-        is_followed = Follow.objects.filter(
-            author__username=username,
-            user=request.user
-        ).exists()
-    else:
-        is_followed = False
+    posts_amount = stats_for(author).posts_count
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
         'author': post.author,
-        'comments': post.comments.all(),
+        'comments': comments_page(request, post),
         'posts_amount': posts_amount,
-        'is_followed': is_followed,
+        'is_followed': is_followed(request, author.pk),
         'form': form
     }
 
@@ -83,26 +102,44 @@ def post_view(request, username, post_id):
     )
 
 
+@conditional_page(post_state)
+@cache_anonymous('author:{username}')
+def comments(request, username, post_id):
+    """Следующая страница комментариев поста без остальной страницы,
+    для подгрузки."""
+    post = get_object_or_404(
+        Post.objects.select_related('author'),
+        id=post_id,
+        author__username=username
+    )
+    return render(request,
+                  'includes/comments.html',
+                  {'post': post,
+                   'comments': comments_page(request, post)}
+                  )
+
+
+@cache_anonymous('all')
 def index(request):
     """Выводит последние посты по дате, по PAGE_MAX на странице."""
-    posts_all = Post.objects.select_related('author').all()
-    paginator = Paginator(posts_all, settings.PAGE_MAX)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts_all = Post.objects.select_related('author', 'group')
+    page = paginate(request, posts_all)
+    prefetch_thumbnails(page)
     return render(request,
                   'posts/index.html',
                   {'page': page, }
                   )
 
 
+@conditional_page(group_state)
+@cache_anonymous('group:{slug}')
 def group_posts(request, slug):
     """Выводит последние посты по PAGE_MAX на странице,
     только посты из группы."""
     group = get_object_or_404(Group, slug=slug)
-    posts_all = group.posts.select_related('author').all()
-    paginator = Paginator(posts_all, settings.PAGE_MAX)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts_all = group.posts.select_related('author')
+    page = paginate(request, posts_all)
+    prefetch_thumbnails(page)
     return render(request,
                   'posts/group.html',
                   {'page': page,
@@ -120,7 +157,9 @@ class NewPosts(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        pregenerate(self.object)
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -154,7 +193,7 @@ def post_edit(request, username, id_post):
     )
 
     if form.is_valid():
-        form.save()
+        pregenerate(form.save())
         return HttpResponseRedirect(url_redirect)
     else:
         return render(
@@ -179,23 +218,15 @@ def add_comment(request, username, post_id):
         return HttpResponseRedirect(reverse('post', args=[username, post_id]))
 
     author = post.author
-    posts_amount = author.posts.count()
-    user = author.follower.count()
-    following = author.following.count()
-    is_followed = Follow.objects.filter(
-        author__username=username,
-        user=request.user
-    ).exists()
+    posts_amount = stats_for(author).posts_count
     return render(
         request,
         'posts/post.html', {
             'post': post,
             'author': post.author,
-            'comments': post.comments.all(),
+            'comments': comments_page(request, post),
             'posts_amount': posts_amount,
-            'follower': user,
-            'following': following,
-            'is_followed': is_followed,
+            'is_followed': is_followed(request, author.pk),
             'form': form,
         }
     )
@@ -203,15 +234,47 @@ def add_comment(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    """Показывает посты от избранных авторов."""
-    subscriptions = request.user.follower.values_list('author__id', flat=True)
-    posts_all = Post.objects.filter(author__id__in=subscriptions)
-    paginator = Paginator(posts_all, settings.PAGE_MAX)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    """Показывает посты от избранных авторов. Первая страница отмечает
+    самый новый пост ленты прочитанным."""
+    posts_all = Post.objects.select_related('author', 'group')
+    page = FeedPaginator(
+        posts_all, settings.PAGE_MAX, user=request.user
+    ).get_page(request.GET.get('cursor'))
+    if page and not page.has_previous():
+        mark_seen(request.user, page[0].pub_date)
+    prefetch_thumbnails(page)
     return render(request,
                   'posts/follow.html',
-                  {'page': page, }
+                  {'page': page,
+                   'suggestions': suggested(request)}
+                  )
+
+
+@login_required
+@conditional_page(unread_state)
+def follow_unread(request):
+    """Число новых постов ленты подписок для опроса со страницы вместо
+    её перезагрузки. Пока число не изменилось, на запрос с ETag
+    отвечает 304."""
+    unread = unread_posts(request)
+    return JsonResponse({
+        'unread': min(unread, settings.FEED_UNREAD_MAX),
+        'more': unread > settings.FEED_UNREAD_MAX,
+    })
+
+
+def search(request):
+    """Ищет посты по словам из параметра q, самые подходящие - первыми."""
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(query).select_related('author', 'group')
+    page = Paginator(posts, settings.PAGE_MAX).get_page(
+        request.GET.get('page')
+    )
+    prefetch_thumbnails(page)
+    return render(request,
+                  'posts/search.html',
+                  {'page': page,
+                   'query': query}
                   )
 
 
@@ -237,6 +300,23 @@ def profile_unfollow(request, username):
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
 
+@login_required
+def export(request):
+    """Отдаёт посты и комментарии пользователя потоком в формате
+    из параметра format: ndjson (по умолчанию) или csv."""
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest('format: ndjson или csv')
+    response = StreamingHttpResponse(
+        export_lines(request.user, export_format, settings.EXPORT_CHUNK_SIZE),
+        content_type=FORMATS[export_format]
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{request.user.username}.{export_format}"'
+    )
+    return response
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -30,6 +30,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.metrics.MetricsMiddleware',
+    'posts.slow_queries.SlowQueryMiddleware',
+    'posts.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,7 +48,8 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Шаблоны Django, которые считают время отрисовки для /metrics
+        'BACKEND': 'posts.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -66,8 +70,35 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Соединение живёт столько секунд между запросами потока;
+        # 0 - закрывается после каждого ответа, None - не закрывается
+        'CONN_MAX_AGE': 60,
+    },
+    # Копия default только для чтения, которую ведёт внешняя репликация
+    # (например, litestream); используется, если указана в DATABASE_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+    },
+}
+# Выполняются на каждом новом соединении с SQLite (posts/sqlite.py).
+# WAL: читатели не ждут писателя; synchronous=normal в WAL не теряет
+# целостность, только последние коммиты при отключении питания;
+# cache_size в КБ со знаком минус, mmap_size и busy_timeout - байты и мс
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'memory',
 }
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+# Базы для чтения в запросах; пусто - всё читается из default
+DATABASE_REPLICAS = []
+# Сколько секунд после записи чтения пользователя идут в default
+REPLICA_STICKY_SECONDS = 10
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -99,11 +130,44 @@ USE_TZ = True
 # Определяет число постов на страницу
 PAGE_MAX = 10
 
+# Число комментариев на страницу поста и в подгружаемой части
+COMMENTS_PAGE_MAX = 50
+
+# Ленты длиннее этого числа постов листаются по курсору (pub_date, id),
+# короткие - по номерам страниц
+PAGE_NUMBERED_MAX = 100
+
+# Лента подписок: посты авторов, у которых подписчиков больше
+# FEED_FANOUT_MAX, не раскладываются по лентам, а подмешиваются при чтении
+FEED_FANOUT_MAX = 10000
+# Сколько последних постов автора попадает в ленту при подписке
+FEED_BACKFILL = 1000
+FEED_BATCH_SIZE = 500
+# Счётчик новых постов ленты в меню показывает не больше этого числа,
+# дальше - «99+»
+FEED_UNREAD_MAX = 99
+# Сколько рекомендаций «кого почитать» хранится на пользователя
+# (python manage.py compute_suggestions)
+SUGGESTIONS_TOP = 5
+
+# JSON API: наибольшее число постов в одном пакетном запросе по id
+API_BATCH_MAX = 100
+
+# Выгрузка данных пользователя читает базу частями по столько строк
+EXPORT_CHUNK_SIZE = 1000
+
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Имена с хэшем и сжатые копии .gz/.br собирает collectstatic
+STATICFILES_STORAGE = 'posts.assets.CompressedManifestStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Кто отдаёт содержимое файлов из MEDIA_ROOT: None - само приложение,
+# 'x-sendfile' - Apache (mod_xsendfile) или lighttpd по полному пути,
+# 'x-accel-redirect' - nginx через internal location MEDIA_OFFLOAD_PREFIX
+MEDIA_OFFLOAD = None
+MEDIA_OFFLOAD_PREFIX = '/protected-media/'
 
 # Login
 
@@ -120,3 +184,79 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Миниатюры постов создаются в пуле из THUMBNAIL_WORKERS потоков после
+# загрузки, до готовности отдаётся заглушка; при 0 - в потоке запроса
+THUMBNAIL_BACKEND = 'posts.thumbnails.BackgroundThumbnailBackend'
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_DUMMY_SOURCE = STATIC_URL + 'posts/placeholder.svg'
+# Размеры миниатюр, которые создаются заранее, как в post_card.html
+POST_THUMBNAILS = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+# Записи kvstore миниатюр держатся в LRU процесса перед кэшем и базой
+THUMBNAIL_KVSTORE = 'posts.kvstore.LRUKVStore'
+THUMBNAIL_LRU_MAX_ENTRIES = 10000
+THUMBNAIL_LRU_MAX_BYTES = 4 * 1024 * 1024
+THUMBNAIL_LRU_TTL = 5 * 60
+
+# Фоновая очередь задач в базе (posts/tasks.py), выполняет
+# python manage.py task_worker. Без TASK_QUEUE задачи выполняются сразу
+# в потоке запроса
+TASK_QUEUE = True
+# Потоков (или процессов, task_worker --processes) у исполнителя
+TASK_WORKERS = 2
+TASK_POLL_SECONDS = 1
+# Задача, за которую исполнитель не отчитался столько секунд,
+# снова доступна другим: он мог упасть
+TASK_VISIBILITY_TIMEOUT = 5 * 60
+TASK_MAX_ATTEMPTS = 5
+# Пауза перед повтором после ошибки удваивается от TASK_RETRY_DELAY
+# до TASK_RETRY_DELAY_MAX секунд
+TASK_RETRY_DELAY = 10
+TASK_RETRY_DELAY_MAX = 60 * 60
+# Из скольких доступных задач исполнитель выбирает незанятую
+TASK_CLAIM_BATCH = 10
+# Сколько секунд хранятся выполненные задачи
+TASK_KEEP_DONE = 24 * 60 * 60
+
+# Страницы для анонимных посетителей сбрасываются по поколениям при
+# записи постов, комментариев и подписок, срок хранения - запасной
+ANON_PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Метрики /metrics копятся в процессе; с METRICS_DIR каждый процесс
+# раз в METRICS_FLUSH_SECONDS пишет их в свой файл, и выгрузка
+# складывает все процессы
+METRICS_DIR = None
+METRICS_FLUSH_SECONDS = 5
+
+# Журнал медленных (от SLOW_QUERY_MS) и повторяющихся (от
+# SLOW_QUERY_REPEATS раз за ответ) SQL-запросов с view и строкой шаблона;
+# сводка - python manage.py analyze_slow_queries
+SLOW_QUERY_LOG = False
+SLOW_QUERY_MS = 100
+SLOW_QUERY_REPEATS = 5
+SLOW_QUERY_LOG_FILE = os.path.join(BASE_DIR, 'slow_queries.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.FileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'formatter': 'message',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'posts.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
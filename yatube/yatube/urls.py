@@ -1,24 +1,23 @@
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf.urls import handler404, handler500
 from django.conf import settings
-from django.conf.urls.static import static
+
+from posts import assets, metrics
 
 
 handler404 = 'posts.views.page_not_found'
 handler500 = 'posts.views.server_error'
 
-urlpatterns = [path('auth/', include('users.urls')),
+urlpatterns = [re_path(rf'^{settings.STATIC_URL.lstrip("/")}(?P<path>.+)$',
+                       assets.serve),
+               re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$',
+                       assets.serve_media),
+               path('metrics', metrics.metrics),
+               path('auth/', include('users.urls')),
                path('auth/', include('django.contrib.auth.urls')),
                path('admin/', admin.site.urls),
+               path('api/v1/', include('posts.api_urls', namespace='api')),
                path('', include('posts.urls')),
                path('about/', include('about.urls', namespace='about')),
                ]
-
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
-    urlpatterns += static(
-        settings.STATIC_URL, document_root=settings.STATIC_ROOT
-    )